@@ -0,0 +1,388 @@
+"""Event-loop (ASGI) serving mode for proto, for bedside screens with many viewers.
+
+    python asgi_server.py --port 5000
+
+Serves the same API as `python proto.py`, so Monitor.tsx works unchanged. The streaming and
+polling routes (video_feed, status_update, status_stream, reset, and their /sessions/<id>/
+forms) run as coroutines on one event loop, woken by the session's FrameBroadcaster and
+StatusPublisher instead of parking one thread per connected client. JPEG encoding runs on a
+small thread pool, once per frame and stream setting however many clients share it. Every other
+route is answered by the Flask app in proto on a worker thread.
+
+Needs uvicorn (`pip install uvicorn`).
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+import proto
+
+ENCODE_WORKERS = 4  # Threads JPEG-encoding frames for the MJPEG streams
+FLASK_WORKERS = 8  # Threads answering the routes that are delegated to the Flask app
+
+MJPEG_CONTENT_TYPE = b'multipart/x-mixed-replace; boundary=frame'
+JSON_CONTENT_TYPE = b'application/json'
+CORS_HEADERS = [(b'access-control-allow-origin', b'*')]  # What flask_cors adds to the Flask routes
+
+
+class AsyncNotifier:
+    """Wakes coroutines on one event loop whenever a FrameBroadcaster or StatusPublisher changes.
+
+    The publisher's thread schedules a single callback per change, however many coroutines are
+    waiting; wait() returns True when woken and False on timeout.
+    """
+
+    def __init__(self, loop, publisher):
+        self._loop = loop
+        self._publisher = publisher
+        self._event = asyncio.Event()
+        publisher.add_listener(self._on_change)
+
+    def _on_change(self):
+        # Runs on the publisher's thread
+        try:
+            self._loop.call_soon_threadsafe(self._wake)
+        except RuntimeError:
+            pass  # The loop has been closed
+
+    def _wake(self):
+        event, self._event = self._event, asyncio.Event()
+        event.set()
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def close(self):
+        self._publisher.remove_listener(self._on_change)
+
+
+class StreamingApp:
+    """ASGI application: the streaming routes natively, everything else through the Flask app."""
+
+    def __init__(self, flask_app=proto.app):
+        self.flask_app = flask_app
+        self._loop = None
+        self._encoder = ThreadPoolExecutor(max_workers=ENCODE_WORKERS, thread_name_prefix="asgi-encode")
+        self._flask_pool = ThreadPoolExecutor(max_workers=FLASK_WORKERS, thread_name_prefix="asgi-flask")
+        self._notifiers = {}  # publisher -> [AsyncNotifier, coroutines using it]
+        self._encodes = {}  # (FrameBroadcaster, StreamParams) -> (seq, future of (seq, jpeg_bytes))
+        self._routes = {
+            ('GET', 'video_feed'): self._video_feed,
+            ('GET', 'status_update'): self._status_update,
+            ('GET', 'status_stream'): self._status_stream,
+            ('POST', 'reset'): self._reset,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+
+        route = _split_route(scope['path'])
+        handler = route and self._routes.get((scope['method'], route[1]))
+        if handler is None:
+            await self._call_flask(scope, receive, send)
+            return
+
+        session_id = route[0]
+        if session_id is None:
+            # Only a read of the module global, so no need for proto.monitor_lock on the event loop
+            session = proto.monitor
+        else:
+            session = proto.session_manager.get(session_id)
+            if session is None:
+                await _send_json(send, {"status": "error", "message": f"Unknown session '{session_id}'"}, 404)
+                return
+        query = dict(parse_qsl(scope['query_string'].decode('latin-1')))
+        await handler(session, query, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self._loop = asyncio.get_running_loop()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self._encoder.shutdown(wait=False)
+                self._flask_pool.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @contextlib.contextmanager
+    def _watch(self, publisher):
+        """The loop's AsyncNotifier for publisher, shared by every coroutine watching it."""
+        entry = self._notifiers.get(publisher)
+        if entry is None:
+            entry = self._notifiers[publisher] = [AsyncNotifier(self._loop, publisher), 0]
+        entry[1] += 1
+        try:
+            yield entry[0]
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._notifiers[publisher]
+                entry[0].close()
+                for key in [key for key in self._encodes if key[0] is publisher]:
+                    del self._encodes[key]
+
+    async def _jpeg_for(self, broadcaster, seq, params):
+        """Encodes the newest frame on the encoder pool; clients asking for the same seq and params await one encode."""
+        key = (broadcaster, params)
+        pending = self._encodes.get(key)
+        if pending is None or pending[0] != seq:
+            future = self._loop.run_in_executor(self._encoder, broadcaster.jpeg_for, params)
+            pending = self._encodes[key] = (seq, future)
+        # Shielded so a client that disconnects mid-encode does not cancel it for the others
+        return await asyncio.shield(pending[1])
+
+    async def _video_feed(self, session, query, receive, send):
+        """MJPEG stream; same query parameters and adaptive quality as proto.generate_frames."""
+        params, max_fps = proto.parse_stream_params(query)
+        await _start_response(send, 200, MJPEG_CONTENT_TYPE)
+        await _until_disconnect(receive, self._stream_frames(session, params, max_fps, send))
+
+    async def _stream_frames(self, session, params, max_fps, send):
+        broadcaster = session.broadcaster if session else None
+        if broadcaster is None:
+            placeholder = _mjpeg_part(proto.placeholder_jpeg())
+            while True:
+                await send({'type': 'http.response.body', 'body': placeholder, 'more_body': True})
+                await asyncio.sleep(proto.STREAM_IDLE_RESEND_SECONDS)
+
+        current = params
+        quality_control = proto.StreamQualityController(params)
+        period = 1.0 / max_fps if max_fps else 0.0
+        deadline = time.monotonic()
+        broadcaster.subscribe(current)
+        try:
+            with self._watch(broadcaster) as frames:
+                last_seq, frame_bytes = -1, None
+                while True:
+                    seq = broadcaster.seq
+                    if seq == last_seq:
+                        if await frames.wait(proto.STREAM_IDLE_RESEND_SECONDS) or frame_bytes is None:
+                            continue
+                        # No new frame for a while: re-send the last one, as proto.generate_frames does
+                    else:
+                        last_seq, encoded = await self._jpeg_for(broadcaster, seq, current)
+                        if encoded is None:
+                            continue
+                        frame_bytes = encoded
+                    started = time.monotonic()
+                    # send() only returns once the transport has buffer room again, so a long
+                    # wait here means the client is not draining the socket
+                    await send({'type': 'http.response.body', 'body': _mjpeg_part(frame_bytes), 'more_body': True})
+
+                    next_params = quality_control.after_write(time.monotonic() - started)
+                    if next_params != current:
+                        broadcaster.unsubscribe(current)
+                        current = next_params
+                        broadcaster.subscribe(current)
+                    if period:
+                        # Same deadline pacing as proto.FramePacer, without blocking the loop
+                        deadline += period
+                        delay = deadline - time.monotonic()
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                        elif delay < -period:
+                            deadline = time.monotonic()
+        finally:
+            broadcaster.unsubscribe(current)
+
+    async def _status_update(self, session, query, receive, send):
+        await _send_json(send, proto.status_payload(session))
+
+    async def _status_stream(self, session, query, receive, send):
+        """Server-sent events; same events and keepalives as proto.generate_status_events."""
+        await _start_response(send, 200, b'text/event-stream; charset=utf-8',
+                              [(b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no')])
+        await _until_disconnect(receive, self._stream_status(session, send))
+
+    async def _stream_status(self, session, send):
+        if session is None:
+            await _send_body(send, f"data: {json.dumps(proto.status_payload(None))}\n\n".encode(), more_body=False)
+            return
+
+        publisher = session.status
+        with self._watch(publisher) as changes:
+            last_version = -1
+            while True:
+                version, snapshot = publisher.current()
+                if version == last_version:
+                    if not await changes.wait(proto.STATUS_HEARTBEAT_SECONDS):
+                        await _send_body(send, b": keepalive\n\n")
+                    continue
+                last_version = version
+                await _send_body(send, proto.status_event(version, snapshot).encode())
+
+    async def _reset(self, session, query, receive, send):
+        payload, status = proto.reset_session(session)
+        await _send_json(send, payload, status)
+
+    async def _call_flask(self, scope, receive, send):
+        """Answers the request with the Flask app on a worker thread (buffered: no streaming routes go here)."""
+        chunks = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body', False):
+                break
+
+        environ = _wsgi_environ(scope, b''.join(chunks))
+        status, headers, body = await self._loop.run_in_executor(self._flask_pool, _run_wsgi, self.flask_app, environ)
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]})
+        await _send_body(send, body, more_body=False)
+
+
+def _split_route(path):
+    """Returns (session_id, endpoint) for /<endpoint> (session_id None: the default session) and
+    /sessions/<session_id>/<endpoint>, or None for any other path."""
+    parts = path.strip('/').split('/')
+    if len(parts) == 1:
+        return None, parts[0]
+    if len(parts) == 3 and parts[0] == 'sessions':
+        return parts[1], parts[2]
+    return None
+
+
+def _mjpeg_part(jpeg):
+    return b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n'
+
+
+async def _start_response(send, status, content_type, headers=()):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', content_type), *CORS_HEADERS, *headers]})
+
+
+async def _send_body(send, body, more_body=True):
+    await send({'type': 'http.response.body', 'body': body, 'more_body': more_body})
+
+
+async def _send_json(send, payload, status=200):
+    body = json.dumps(payload).encode()
+    await _start_response(send, status, JSON_CONTENT_TYPE, [(b'content-length', str(len(body)).encode())])
+    await _send_body(send, body, more_body=False)
+
+
+async def _until_disconnect(receive, stream):
+    """Runs the stream coroutine until it ends or the client disconnects, whichever comes first."""
+    async def disconnected():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    stream_task = asyncio.ensure_future(stream)
+    disconnect_task = asyncio.ensure_future(disconnected())
+    try:
+        await asyncio.wait({stream_task, disconnect_task}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        stream_task.cancel()
+        disconnect_task.cancel()
+        # Let the stream's finally blocks (unsubscribe, remove listeners) run before returning
+        await asyncio.gather(stream_task, disconnect_task, return_exceptions=True)
+    if not stream_task.cancelled() and stream_task.exception() is not None:
+        raise stream_task.exception()
+
+
+def _wsgi_environ(scope, body):
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    client = scope.get('client')
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0] if client else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name, value = name.decode('latin-1'), value.decode('latin-1')
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        elif name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _run_wsgi(wsgi_app, environ):
+    """Calls wsgi_app and returns (status code, headers, body)."""
+    response = {}
+    chunks = []
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = headers
+        return chunks.append
+
+    result = wsgi_app(environ, start_response)
+    try:
+        chunks.extend(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return response['status'], response['headers'], b''.join(chunks)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the adherence protocol API from an asyncio event loop.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    import uvicorn
+
+    print("=" * 60)
+    print("🚀 Starting Medication Adherence Protocol System (ASGI)")
+    print("=" * 60)
+
+    # Same default session as `python proto.py`, served by the legacy routes
+    proto.monitor = proto.session_manager.create(
+        proto.DEFAULT_SESSION_ID,
+        video_source=0,
+        obj_weights_path=proto.YOLO_OBJ_WEIGHT_PATH,
+        max_frames=200
+    )
+    print("✅ Protocol thread started")
+
+    if not proto.HEADLESS_MODE:
+        threading.Thread(target=proto.open_browser, daemon=True).start()
+    else:
+        print("🖥️  Headless mode: no local window or browser; watch via /video_feed")
+
+    print(f"✅ Starting ASGI server on http://localhost:{args.port}")
+    print("=" * 60)
+    uvicorn.run(StreamingApp(), host=args.host, port=args.port, log_level="warning")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""Microbenchmark of the box post-processing in YOLOv11MedicationMonitor._detect_objects.
+
+Compares the per-box Python loop it used to run against proto.select_class_boxes (NumPy
+reductions, or a single-pass loop under proto.SMALL_OUTPUT_BOXES) on synthetic detector outputs
+with a growing number of boxes, and checks that both pick the same best box per target class:
+
+    python bench_postprocess.py --boxes 5,10,20,100,1000,5000 --repeat 200
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+import proto
+
+CLASS_NAMES = list(proto.TARGET_CLASSES) + ['mouth', 'cup']
+
+
+def synthetic_output(n_boxes, rng):
+    x1 = rng.uniform(0, 600, n_boxes)
+    y1 = rng.uniform(0, 440, n_boxes)
+    xyxy = np.stack([x1, y1, x1 + rng.uniform(5, 40, n_boxes), y1 + rng.uniform(5, 40, n_boxes)], axis=1)
+    return proto.DetectorOutput(xyxy.astype(np.float32), rng.uniform(0.1, 1.0, n_boxes).astype(np.float32),
+                                rng.integers(0, len(CLASS_NAMES), n_boxes).astype(np.intp))
+
+
+def loop_select(output, class_names, offset=(0, 0)):
+    """The former per-box loop, with one scalar read per box field."""
+    ox, oy = offset
+    best = {cls: (0.0, None) for cls in proto.TARGET_CLASSES}
+    for i in range(len(output.conf)):
+        conf = output.conf[i].item(); cls = int(output.cls[i].item())
+        label = class_names[cls] if cls < len(class_names) else None
+        if label in proto.TARGET_CLASSES:
+            x1, y1, x2, y2 = map(int, output.xyxy[i].tolist()); x1 += ox; x2 += ox; y1 += oy; y2 += oy
+            w, h = x2 - x1, y2 - y1; cx, cy = x1 + w // 2, y1 + h // 2
+            if conf > best[label][0]: best[label] = (conf, (cx, cy, w, h))
+    return best
+
+
+def time_per_call(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark per-box loop vs select_class_boxes.")
+    parser.add_argument("--boxes", default="5,10,20,100,1000,5000", help="Comma-separated box counts")
+    parser.add_argument("--repeat", type=int, default=200, help="Calls timed per box count")
+    parser.add_argument("--top-k", type=int, default=proto.DETECTION_TOP_K)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    target_ids = proto.target_class_ids(CLASS_NAMES)
+    print(f"{'boxes':>7} {'loop us':>10} {'select us':>10} {'speedup':>8}")
+    for n_boxes in (int(n) for n in args.boxes.split(',')):
+        output = synthetic_output(n_boxes, rng)
+        expected = loop_select(output, CLASS_NAMES, (32, 16))
+        selected = proto.select_class_boxes(output, target_ids, (32, 16), args.top_k)
+        for cls in proto.TARGET_CLASSES:
+            got = selected[cls][0] if cls in selected else (0.0, None)
+            if got != expected[cls]:
+                print(f"❌ {n_boxes} boxes: {cls} mismatch, loop {expected[cls]} vs select {got}")
+                return 1
+
+        loop_s = time_per_call(lambda: loop_select(output, CLASS_NAMES, (32, 16)), args.repeat)
+        numpy_s = time_per_call(lambda: proto.select_class_boxes(output, target_ids, (32, 16), args.top_k), args.repeat)
+        print(f"{n_boxes:>7} {loop_s * 1e6:>10.1f} {numpy_s * 1e6:>10.1f} {loop_s / numpy_s:>7.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""Accuracy / speed comparison of detector backends on recorded clips.
+
+Replays every clip once per model (the first one is the reference) and reports throughput,
+YOLO stage latency, verdict agreement and per-frame detection agreement with the reference:
+
+    python compare_backends.py clips/*.mp4 --model pt=best.pt --model onnx=best.onnx \
+        --model int8=best_int8.onnx --model openvino=best_openvino_model/ --json compare.json
+
+Detection agreement is measured per target class on the frames both runs reached: how often
+the class is found by one run and not the other, the IoU of the two boxes when both found it,
+and the mean confidence difference.
+"""
+import argparse
+import json
+import sys
+
+import numpy as np
+
+import proto
+from replay import replay_clip
+
+
+def _iou(a, b):
+    """IoU of two (cx, cy, w, h) boxes."""
+    ax1, ay1, bx1, by1 = a[0] - a[2] / 2, a[1] - a[3] / 2, b[0] - b[2] / 2, b[1] - b[3] / 2
+    inter_w = max(0.0, min(ax1 + a[2], bx1 + b[2]) - max(ax1, bx1))
+    inter_h = max(0.0, min(ay1 + a[3], by1 + b[3]) - max(ay1, by1))
+    inter = inter_w * inter_h
+    union = a[2] * a[3] + b[2] * b[3] - inter
+    return inter / union if union > 0 else 0.0
+
+
+def compare_detections(reference_log, candidate_log):
+    """Per-class agreement of two runs' detection logs over the frames both reached."""
+    frames = min(len(reference_log), len(candidate_log))
+    report = {}
+    for cls in proto.TARGET_CLASSES:
+        mismatches, ious, conf_deltas = 0, [], []
+        for reference, candidate in zip(reference_log[:frames], candidate_log[:frames]):
+            (ref_conf, ref_box), (cand_conf, cand_box) = reference[cls], candidate[cls]
+            if (ref_box is None) != (cand_box is None):
+                mismatches += 1
+            elif ref_box is not None:
+                ious.append(_iou(ref_box, cand_box))
+                conf_deltas.append(abs(ref_conf - cand_conf))
+        report[cls] = {
+            "frames": frames,
+            "presence_mismatch_rate": mismatches / frames if frames else 0.0,
+            "mean_iou": float(np.mean(ious)) if ious else None,
+            "mean_conf_delta": float(np.mean(conf_deltas)) if conf_deltas else None,
+        }
+    return report
+
+
+def _mean(values):
+    values = [value for value in values if value is not None]
+    return float(np.mean(values)) if values else None
+
+
+def print_comparison(rows):
+    print(f"{'model':<12} {'backend':<12} {'fps':>8} {'yolo p95':>9} {'verdicts':>9}")
+    for row in rows:
+        print(f"{row['name']:<12} {row['backend']:<12} {row['fps']:>8.1f} {row['yolo_p95_ms']:>7g}ms "
+              f"{row['verdicts_agree']:>4}/{row['clips']:<4}")
+        for cls, stats in row["detections"].items():
+            iou = f"{stats['mean_iou']:.3f}" if stats["mean_iou"] is not None else "-"
+            conf = f"{stats['mean_conf_delta']:.3f}" if stats["mean_conf_delta"] is not None else "-"
+            print(f"    {cls:<16} mismatched {stats['presence_mismatch_rate']:6.1%}  IoU {iou}  conf delta {conf}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare detector backends for accuracy and speed on recorded clips.")
+    parser.add_argument("clips", nargs="+", help="Video files or directories of images")
+    parser.add_argument("--model", action="append", required=True,
+                        help="NAME=WEIGHTS (repeatable); the first is the reference")
+    parser.add_argument("--json", dest="json_path", help="Write the comparison to this file")
+    args = parser.parse_args(argv)
+
+    models = [spec.partition('=')[::2] for spec in args.model]
+    runs = {}
+    for name, weights_path in models:
+        print(f"🔄 Replaying {len(args.clips)} clip(s) with {name} ({weights_path})")
+        runs[name] = [replay_clip(path, weights_path, keep_detections=True) for path in args.clips]
+
+    reference_name = models[0][0]
+    rows = []
+    for name, weights_path in models:
+        records = runs[name]
+        frames = sum(record["frames"] for record in records)
+        seconds = sum(record["wall_seconds"] for record in records)
+        per_class = {}
+        for record, reference in zip(records, runs[reference_name]):
+            for cls, stats in compare_detections(reference["detection_log"], record["detection_log"]).items():
+                per_class.setdefault(cls, []).append(stats)
+        rows.append({
+            "name": name,
+            "weights": weights_path,
+            "backend": "mock" if weights_path == "MOCK" else proto.resolve_detector_backend(weights_path),
+            "clips": len(records),
+            "fps": frames / seconds if seconds > 0 else 0.0,
+            "yolo_p95_ms": max((record["stages"].get("yolo", {}).get("p95_ms", 0.0) for record in records), default=0.0),
+            "verdicts_agree": sum(record["result_status"] == reference["result_status"]
+                                  for record, reference in zip(records, runs[reference_name])),
+            "detections": {
+                cls: {
+                    "presence_mismatch_rate": _mean(s["presence_mismatch_rate"] for s in stats),
+                    "mean_iou": _mean(s["mean_iou"] for s in stats),
+                    "mean_conf_delta": _mean(s["mean_conf_delta"] for s in stats),
+                }
+                for cls, stats in per_class.items()
+            },
+            "verdicts": {record["clip"]: record["result_status"] for record in records},
+        })
+
+    print_comparison(rows)
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(rows, f, indent=4)
+        print(f"✅ Comparison written to {args.json_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""Exports the trained YOLO weights for the faster CPU detector backends in proto.
+
+    python export_model.py best.pt --format onnx
+    python export_model.py best.pt --format onnx --int8 --calibration clips/*.mp4
+    python export_model.py best.pt --format openvino
+
+Each export gets a sidecar JSON (see proto.detector_metadata_path) with the class names and
+input size, which proto.load_detector reads. Point YOLO_OBJ_WEIGHT_PATH (or replay.py --weights)
+at the exported file and DETECTOR_BACKEND="auto" picks the matching backend.
+
+--int8 quantizes the ONNX export statically with ONNX Runtime, calibrated on frames sampled
+from recorded clips; the resulting QDQ model also runs on OpenVINO. Compare the variants on
+recorded clips with compare_backends.py before deploying one.
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+import proto
+from replay import iter_clip_frames
+
+
+def export(weights_path, export_format, imgsz, half=False):
+    """Exports weights_path with ultralytics and returns (exported path, class names)."""
+    from ultralytics import YOLO
+    model = YOLO(weights_path)
+    names = [model.names[i] for i in sorted(model.names)]
+    # Dynamic axes let the exported model take both the full-frame and the ROI_IMGSZ input
+    exported = model.export(format=export_format, imgsz=imgsz, dynamic=True, half=half)
+    return str(exported), names
+
+
+def calibration_batches(clip_paths, imgsz, max_frames, stride):
+    """Yields letterboxed 1x3xHxW float blobs from every stride-th clip frame, max_frames at most."""
+    frames = (frame for path in clip_paths for i, frame in enumerate(iter_clip_frames(path)) if i % stride == 0)
+    for _, frame in zip(range(max_frames), frames):
+        padded, _, _ = proto.letterbox(frame, (imgsz, imgsz))
+        blob = np.ascontiguousarray(padded[None, ..., ::-1].transpose(0, 3, 1, 2), dtype=np.float32)
+        yield blob / 255.0
+
+
+def quantize_int8(onnx_path, clip_paths, imgsz, max_frames, stride):
+    """Writes a statically quantized INT8 copy of onnx_path next to it and returns its path."""
+    import onnxruntime
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    input_name = onnxruntime.InferenceSession(onnx_path, providers=list(proto.ONNX_PROVIDERS)).get_inputs()[0].name
+
+    class ClipReader(CalibrationDataReader):
+        def __init__(self):
+            self._batches = calibration_batches(clip_paths, imgsz, max_frames, stride)
+
+        def get_next(self):
+            blob = next(self._batches, None)
+            return None if blob is None else {input_name: blob}
+
+    int8_path = os.path.splitext(onnx_path)[0] + "_int8.onnx"
+    quantize_static(onnx_path, int8_path, ClipReader(), quant_format=QuantFormat.QDQ, per_channel=True,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+    return int8_path
+
+
+def write_metadata(exported_path, names, imgsz, **extra):
+    path = proto.detector_metadata_path(exported_path)
+    with open(path, 'w') as f:
+        json.dump({"names": names, "imgsz": imgsz, **extra}, f, indent=4)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export YOLO weights for the ONNX Runtime / OpenVINO detector backends.")
+    parser.add_argument("weights", help="Trained .pt weights")
+    parser.add_argument("--format", choices=("onnx", "openvino"), default="onnx")
+    parser.add_argument("--imgsz", type=int, default=proto.DETECTOR_IMGSZ, help="Default full-frame input size")
+    parser.add_argument("--half", action="store_true", help="FP16 weights (OpenVINO)")
+    parser.add_argument("--int8", action="store_true", help="Also write a calibrated INT8 ONNX model (needs --calibration)")
+    parser.add_argument("--calibration", nargs="+", default=[], help="Recorded clips to calibrate INT8 on")
+    parser.add_argument("--calibration-frames", type=int, default=200, help="Frames sampled for INT8 calibration")
+    parser.add_argument("--calibration-stride", type=int, default=10, help="Sample every Nth clip frame")
+    args = parser.parse_args(argv)
+
+    if args.int8 and (args.format != "onnx" or not args.calibration):
+        parser.error("--int8 needs --format onnx and --calibration clips")
+
+    exported, names = export(args.weights, args.format, args.imgsz, half=args.half)
+    write_metadata(exported, names, args.imgsz, source=args.weights, format=args.format, half=args.half)
+    print(f"✅ Exported {args.weights} to {exported}")
+
+    if args.int8:
+        int8_path = quantize_int8(exported, args.calibration, args.imgsz, args.calibration_frames, args.calibration_stride)
+        write_metadata(int8_path, names, args.imgsz, source=args.weights, format="onnx", int8=True,
+                       calibration=args.calibration, calibration_frames=args.calibration_frames)
+        print(f"✅ INT8 model calibrated on {len(args.calibration)} clip(s) written to {int8_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,20 @@
 import time
+import math
 import collections
 import cv2
 import numpy as np
-from ultralytics import YOLO
-import mediapipe as mp
-from flask import Flask, Response, jsonify
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
 import threading
+import queue
+from concurrent.futures import Future, ThreadPoolExecutor
 import webbrowser
 import json
 from datetime import datetime
 import os
+import atexit
+import sys
+import types
 
 # --- Flask Setup ---
 app = Flask(__name__)
@@ -19,7 +23,14 @@ CORS(app)
 # Global monitor instance and lock for thread-safe access
 monitor = None
 monitor_lock = threading.Lock()
-camera_ready = threading.Event()  # Signal when camera window opens
+
+# YOLO models shared by every session: weights path -> Future of (model, inference lock). The lock
+# only guards the dicts; models load outside it so /metrics and other sessions never wait on a load.
+_yolo_models = {}
+_yolo_models_lock = threading.Lock()
+_inference_servers = {}  # weights path -> BatchedInferenceServer
+camera_ready = threading.Event()  # Signal when the first camera frame is captured
+_process_started = time.monotonic()  # For the cold-start timings reported on /ready
 
 # --- Configuration ---
 YOLO_OBJ_WEIGHT_PATH = r"C:\Users\User\Desktop\Dot Project\runs\detect\train4\weights\best.pt"
@@ -30,6 +41,26 @@ LOWER_LIP_ID = 14
 MOUTH_OPEN_THRESHOLD = 20
 MOUTH_CLOSURE_THRESHOLD = 5
 
+# Mouth ROI Inference (phases 2-5 only look at the mouth; phase 6 confirms the pill is gone from the
+# whole frame, so a pill palmed away from the face still fails it)
+ROI_MODE = True
+ROI_PHASES = (2, 3, 4, 5)
+MOUTH_LEFT_ID = 61
+MOUTH_RIGHT_ID = 291
+MOUTH_ROI_LANDMARK_IDS = (UPPER_LIP_ID, LOWER_LIP_ID, MOUTH_LEFT_ID, MOUTH_RIGHT_ID)
+ROI_SCALE = 3.0  # Crop side as a multiple of the mouth's larger dimension
+ROI_MIN_SIZE = 192  # Smallest crop side in pixels
+ROI_IMGSZ = 320  # YOLO input size for the crop (full-frame search keeps the model default)
+# Stub mouth landmarks (normalized, like FaceMesh) the MOCK detector reports during replay(), so
+# mock replays reach a real verdict instead of failing on face loss
+MOCK_LIP_LANDMARKS = {
+    landmark_id: types.SimpleNamespace(x=x, y=y, z=0.0)
+    for landmark_id, (x, y) in zip(MOUTH_ROI_LANDMARK_IDS, ((0.50, 0.56), (0.50, 0.64), (0.44, 0.60), (0.56, 0.60)))
+}
+
+# Frame Skipping (YOLO every N frames, boxes carried forward by a motion model in between)
+DETECT_EVERY_N_FRAMES = 1  # 1 = run YOLO on every frame
+
 # Confidence Thresholds
 CPill_P1_MIN = 0.8
 CPill_P3_MIN = 0.4
@@ -38,13 +69,22 @@ CTongue_P4_MAX = 0.2
 CPill_P6_MAX = 0.1
 CHAND_MIN = 0.75
 
-# Stability Check
-PILL_STATIONARY_FRAMES = 60
-CONCEALMENT_FRAMES = 50
-FINAL_CONFIRMATION_FRAMES = 60
-STABILITY_THRESHOLD = 5
+# Stability Check (hold times in seconds of elapsed frame time, so they mean the same at any frame rate;
+# they match the old 60 / 50 / 60 / 20 frame counts at 30 fps)
+PILL_STATIONARY_SECONDS = 2.0
+CONCEALMENT_SECONDS = 50 / 30
+FINAL_CONFIRMATION_SECONDS = 2.0
+FACE_LOSS_SECONDS = 2.0  # Face / mouth lost this long = FATAL FAILURE (MOUTH COVERED)
+STABILITY_THRESHOLD = 5  # Max RMS spread (px) of the pill centroid over the PILL_STATIONARY_SECONDS window
 VERIFIED_PASS = "VERIFIED (PASS)"
-STABILIZATION_FRAMES = 20
+STABILIZATION_SECONDS = 20 / 30  # Face loss is ignored this long into a session while the camera settles
+TIMER_TOLERANCE_SECONDS = 0.001  # A hold counts as met within this, so N frames of 1/fps meet an N/fps hold
+
+# Frame Pacing (deadline-based: each loop sleeps only for what is left of its frame period)
+PACING_TARGET_FPS = 30.0  # 0 = no pacing (run as fast as the camera / models allow)
+MAX_FRAME_GAP_SECONDS = 0.5  # Longest gap between two frames credited to a hold timer (stalls do not count)
+CENTROID_WINDOW_INITIAL_FPS = 120  # Frame rate the pill centroid buffer is first sized for (it grows for faster sources)
+REPLAY_FPS = 30.0  # Frame rate assumed for recorded clips and detection caches, which have no capture times
 
 # Text Display Configuration
 FONT = cv2.FONT_HERSHEY_SIMPLEX
@@ -56,7 +96,82 @@ LINE_THICKNESS = 2
 
 TARGET_CLASSES = ['pill', 'pill-on-tongue', 'tongue-no-pill', 'hand']
 
-mp_face_mesh = mp.solutions.face_mesh
+# Multi-Session Server
+DEFAULT_SESSION_ID = "default"  # Session served by the legacy /video_feed, /status_update and /reset routes
+MAX_SESSIONS = 8  # POST /sessions refuses to start more sessions than this
+# Video sources POST /sessions accepts besides camera indices (file paths or stream URLs), comma
+# separated in PROTO_VIDEO_SOURCES, e.g. "rtsp://bed-3.local/stream". Any other string is refused.
+ALLOWED_VIDEO_SOURCES = tuple(source for source in os.environ.get('PROTO_VIDEO_SOURCES', '').split(',') if source)
+WINDOW_TITLE = 'YOLO Medication Monitor (MediaPipe Jaw Check)'
+
+# Headless Mode (no cv2 window; the browser stream is the only output). Defaults on for
+# PROTO_HEADLESS=1 or a Linux box without a display.
+HEADLESS_MODE = os.environ.get('PROTO_HEADLESS') == '1' or (sys.platform.startswith('linux') and not os.environ.get('DISPLAY'))
+
+# Pipelined Mode (capture / inference / render on separate threads)
+PIPELINED_MODE = False
+PIPELINE_QUEUE_SIZE = 1  # Latest-wins depth between stages; 1 keeps latency lowest
+# Camera frames are read into preallocated buffers that are reused only once every stage holding the
+# frame (pipeline queues, detection, drawing, the stream broadcaster and its encoders) has released it.
+# When all of them are held the grabber drops camera frames, so this bounds the frames in flight.
+FRAME_RING_SLOTS = 8
+CONCURRENT_DETECTION = True  # Run YOLO and FaceMesh side by side inside _yolo_detect
+
+# Batched Inference (one forward pass for frames queued by every session)
+BATCHED_INFERENCE = True
+BATCH_MAX_SIZE = 8  # Run as soon as this many frames are queued...
+BATCH_MAX_WAIT_MS = 10  # ...or once the oldest queued frame has waited this long
+BATCH_STATS_WINDOW = 500  # Number of recent batches kept for the size / queue-wait stats
+
+# Detector Backends ("auto" picks by weights file: .pt -> ultralytics, .onnx -> onnxruntime,
+# .xml or an *_openvino_model directory -> openvino; export_model.py produces the latter two)
+DETECTOR_BACKEND = os.environ.get('PROTO_DETECTOR_BACKEND', 'auto')
+DETECTOR_CONF = 0.1  # Boxes below this confidence are dropped before NMS
+DETECTOR_IOU = 0.7  # NMS overlap threshold (the ultralytics default)
+DETECTOR_MAX_DETECTIONS = 300
+DETECTOR_IMGSZ = 640  # Input size for exported models that do not record their own
+DETECTION_TOP_K = 3  # Boxes kept per target class in detections['top_k'], best first
+SMALL_OUTPUT_BOXES = 32  # Below this many boxes a plain Python loop beats the NumPy reductions (bench_postprocess.py)
+ONNX_PROVIDERS = ('CPUExecutionProvider',)
+OPENVINO_DEVICE = 'CPU'
+
+# Detection Cache (per-frame detections on disk, for threshold tuning without the models)
+DETECTION_CACHE_VERSION = 1
+
+# Session Reports (daily JSON Lines files plus a rollup index, written off the protocol thread)
+REPORT_DIR = "patient_report"
+REPORT_BATCH_SIZE = 50  # Reports written per batch at most
+REPORT_FLUSH_SECONDS = 2.0  # Queued reports are flushed at least this often
+
+# Evidence Recording (annotated session video plus full-resolution keyframes, per session)
+EVIDENCE_RECORDING = False
+EVIDENCE_DIR = "evidence"
+EVIDENCE_FPS = 10  # Frames per second kept in the evidence video; the rest are skipped
+EVIDENCE_MAX_WIDTH = 640  # Video frames are downscaled to this width (keyframes stay full size)
+EVIDENCE_QUEUE_SIZE = 30  # Video frames waiting for the encoder; newer frames are dropped beyond this
+EVIDENCE_KEYFRAME_QUEUE_SIZE = 16  # Keyframes waiting to be written
+EVIDENCE_FOURCC = 'mp4v'
+EVIDENCE_JPEG_QUALITY = 95
+
+# Video Streaming
+STREAM_IDLE_RESEND_SECONDS = 1.0  # Re-send the last JPEG this often when no new frame arrives
+STATUS_HEARTBEAT_SECONDS = 15.0  # Keepalive comment on /status_stream when nothing changed
+# Per-client stream settings come from /video_feed?width=&height=&quality=&fps= (all optional)
+STREAM_DEFAULT_QUALITY = 95  # OpenCV's own default, so clients that ask for nothing see no change
+STREAM_MIN_QUALITY = 30  # Floor for both the quality argument and the automatic drop
+STREAM_QUALITY_STEP = 10  # Automatic changes move in steps, so slowed clients still share encoders
+STREAM_SLOW_WRITE_SECONDS = 0.1  # A frame write blocking this long means the client's socket is behind
+STREAM_RECOVER_FRAMES = 30  # Fast writes in a row before quality steps back up
+TURBOJPEG_ENABLED = True  # Encode with libjpeg-turbo via PyTurboJPEG when it is installed
+
+# Metrics (/metrics, Prometheus text format)
+METRIC_STAGES = ('capture', 'yolo', 'face_mesh', 'state_machine', 'overlay', 'publish', 'jpeg_encode')
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.02, 0.035, 0.05, 0.075, 0.1, 0.15, 0.25, 0.5, 1.0)
+FPS_WINDOW_SECONDS = 5.0  # Effective FPS is measured over this trailing window
+
+# Model Warm-up (dummy frames run once after loading, so the first patient frame is not the slow one)
+WARMUP_FRAME_SIZE = (480, 640)  # (height, width) of the blank warm-up frame
+WARMUP_PASSES = 2  # Forward passes per input size
 
 
 def _convert_bbox_to_xyxy(bbox_info):
@@ -67,48 +182,1745 @@ def _convert_bbox_to_xyxy(bbox_info):
     return (x1, y1, x2, y2)
 
 
+def _placeholder_frame(text="Waiting for camera..."):
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    cv2.putText(frame, text, (50, 240), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+    return frame
+
+
+StreamParams = collections.namedtuple('StreamParams', ['max_width', 'max_height', 'quality'])
+DEFAULT_STREAM_PARAMS = StreamParams(None, None, STREAM_DEFAULT_QUALITY)
+
+_turbojpeg = None  # TurboJPEG instance once loaded, False if unavailable
+
+
+def encode_jpeg(frame, quality):
+    """JPEG-encodes a BGR frame, through libjpeg-turbo when available. Returns bytes or None."""
+    global _turbojpeg
+    if _turbojpeg is None:
+        _turbojpeg = False
+        if TURBOJPEG_ENABLED:
+            try:
+                from turbojpeg import TurboJPEG
+                _turbojpeg = TurboJPEG()
+                print("✅ Streaming JPEGs with libjpeg-turbo")
+            except (ImportError, OSError) as e:
+                print(f"⚠️ PyTurboJPEG unavailable, streaming with cv2.imencode. Reason: {e}")
+    if _turbojpeg:
+        return _turbojpeg.encode(frame, quality=quality)
+    ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buffer.tobytes() if ret else None
+
+
+def _resize_for_stream(frame, params):
+    """Shrinks frame to fit params' max width / height, keeping its aspect ratio."""
+    h, w = frame.shape[:2]
+    scale = min(params.max_width / w if params.max_width else 1.0, params.max_height / h if params.max_height else 1.0)
+    if scale >= 1.0:
+        return frame
+    return cv2.resize(frame, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+
+
+class StreamQualityController:
+    """Per-client automatic JPEG quality: steps down while frame writes block, back up once they don't.
+
+    after_write() takes how long the last frame took to hand to the client's socket and returns
+    the StreamParams to encode the next frame with.
+    """
+
+    def __init__(self, params):
+        self.requested = params
+        self.params = params
+        self.min_quality = min(params.quality, STREAM_MIN_QUALITY)
+        self._fast_writes = 0
+
+    def after_write(self, seconds):
+        quality = self.params.quality
+        if seconds > STREAM_SLOW_WRITE_SECONDS:
+            quality = max(self.min_quality, quality - STREAM_QUALITY_STEP)
+            self._fast_writes = 0
+        elif quality < self.requested.quality:
+            self._fast_writes += 1
+            if self._fast_writes >= STREAM_RECOVER_FRAMES:
+                quality = min(self.requested.quality, quality + STREAM_QUALITY_STEP)
+                self._fast_writes = 0
+        if quality != self.params.quality:
+            self.params = self.params._replace(quality=quality)
+        return self.params
+
+
+class _EncodedStream:
+    """The newest JPEG for one StreamParams, shared by every client using those params."""
+    __slots__ = ('lock', 'seq', 'jpeg', 'clients')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.seq = -1
+        self.jpeg = None
+        self.clients = 0
+
+
+class LatestQueue:
+    """Bounded hand-off between pipeline stages where the newest item always wins.
+
+    put() never blocks: when the queue is full the oldest unread item is dropped and counted,
+    so a slow consumer sees fresh data instead of a growing backlog.
+    """
+
+    def __init__(self, maxsize=1, on_drop=None):
+        self._items = collections.deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+        self._on_drop = on_drop  # Called with each item dropped unread
+        self.closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        dropped = None
+        with self._cond:
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1
+                dropped = self._items[0]
+            self._items.append(item)
+            self._cond.notify()
+        if dropped is not None and self._on_drop is not None:
+            self._on_drop(dropped)
+
+    def get(self, timeout=None):
+        """Returns the oldest unread item, or None on timeout or once closed and drained."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._items or self.closed, timeout=timeout)
+            return self._items.popleft() if self._items else None
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class FrameRing:
+    """Preallocated capture buffers that are only reused once nobody holds them, so reading a
+    frame allocates nothing and never overwrites a frame that is still being read.
+
+    The grabber acquire()s a free slot, reads into its buffer and fill()s the slot with the array
+    the read returned (cv2.VideoCapture.read fills the buffer in place when its shape matches, so
+    the ring follows resolution changes by itself). The frame starts with one holder; anything
+    that keeps it beyond that holder's release() (the stream broadcaster and its encoders)
+    retain()s it first. A slot returns to the free list when its last holder releases it, and
+    acquire() returns None while every slot is held. retain() and release() ignore frames that
+    did not come from the ring, and anything that keeps a frame past its own release (the
+    evidence recorder) must copy it.
+    """
+
+    def __init__(self, slots=FRAME_RING_SLOTS):
+        self._lock = threading.Lock()
+        self._buffers = [None] * slots
+        self._holders = [0] * slots
+        self._free = collections.deque(range(slots))
+
+    def acquire(self):
+        """Reserves a free slot. Returns (slot, buffer), buffer being None until the slot is first
+        filled, or None when every slot is held."""
+        with self._lock:
+            if not self._free:
+                return None
+            slot = self._free.popleft()
+            self._holders[slot] = 1
+            return slot, self._buffers[slot]
+
+    def fill(self, slot, frame):
+        """Records the array read into slot and returns it. frame None (a failed read) frees the slot."""
+        with self._lock:
+            if frame is None:
+                self._holders[slot] = 0
+                self._free.append(slot)
+            else:
+                self._buffers[slot] = frame
+            return frame
+
+    def _held_slot(self, frame):
+        if frame is not None:
+            for slot, buffer in enumerate(self._buffers):
+                if buffer is frame and self._holders[slot]:
+                    return slot
+        return None
+
+    def retain(self, frame):
+        """Adds a holder to frame's slot. The caller must already hold frame (or know a holder does)."""
+        with self._lock:
+            slot = self._held_slot(frame)
+            if slot is not None:
+                self._holders[slot] += 1
+
+    def release(self, frame):
+        with self._lock:
+            slot = self._held_slot(frame)
+            if slot is not None:
+                self._holders[slot] -= 1
+                if not self._holders[slot]:
+                    self._free.append(slot)
+
+
+class FramePacer:
+    """Deadline-based pacing for a loop that should run at target_fps.
+
+    wait() sleeps only for what is left of the current frame period after the work already done,
+    so the loop holds target_fps instead of drifting below it. After an overrun of more than a
+    whole period the schedule restarts from now rather than bursting to catch up.
+    """
+
+    def __init__(self, target_fps=PACING_TARGET_FPS):
+        self.period = 1.0 / target_fps if target_fps > 0 else 0.0
+        self._deadline = None
+
+    def wait(self):
+        if not self.period:
+            return
+        now = time.monotonic()
+        self._deadline = (self._deadline if self._deadline is not None else now) + self.period
+        delay = self._deadline - now
+        if delay > 0:
+            time.sleep(delay)
+        elif delay < -self.period:
+            self._deadline = now
+
+
+class FrameBroadcaster:
+    """Encodes each published frame to JPEG once per StreamParams and fans the bytes out to clients.
+
+    The protocol thread hands over finished frames with publish(), which stores a read-only view
+    rather than a copy. A frame from a FrameRing is retained until it is superseded and for as
+    long as an encoder is reading it, so its buffer is not reused underneath them. Encoding
+    happens lazily in whichever client asks first for a new sequence number, so nothing is
+    encoded while nobody is watching, and slow clients simply pick up the newest frame next time
+    instead of queueing stale ones. Clients asking for the same resolution and quality share one
+    encoder; distinct settings encode in parallel.
+    """
+
+    def __init__(self, metrics=None):
+        self._cond = threading.Condition()
+        self._metrics = metrics
+        self._frame = _placeholder_frame()  # Shown until the protocol publishes its first frame
+        self._source = None  # (frame, FrameRing) the published view belongs to, when it came from a ring
+        self._seq = 0
+        self._streams = {}  # StreamParams -> _EncodedStream
+        self._subscribers = 0
+        self._listeners = []  # Called (on the publishing thread) after every publish
+
+    @property
+    def has_viewers(self):
+        return self._subscribers > 0
+
+    def subscribe(self, params=DEFAULT_STREAM_PARAMS):
+        with self._cond:
+            self._subscribers += 1
+            self._streams.setdefault(params, _EncodedStream()).clients += 1
+
+    def unsubscribe(self, params=DEFAULT_STREAM_PARAMS):
+        with self._cond:
+            self._subscribers = max(0, self._subscribers - 1)
+            stream = self._streams.get(params)
+            if stream is not None:
+                stream.clients -= 1
+                if stream.clients <= 0:
+                    del self._streams[params]
+
+    def add_listener(self, callback):
+        """Registers a no-argument callback run after every publish; it must return quickly."""
+        with self._cond:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        with self._cond:
+            self._listeners.remove(callback)
+
+    def stream_params(self):
+        """Client count per StreamParams currently being encoded."""
+        with self._cond:
+            return {params: stream.clients for params, stream in self._streams.items()}
+
+    def publish(self, frame, ring=None):
+        """Stores a read-only view of a finished frame and wakes waiting clients. Returns the new sequence number.
+
+        With ring, frame is retained in it until the next publish (and while encoders read it).
+        """
+        view = frame.view()
+        view.flags.writeable = False
+        if ring is not None:
+            ring.retain(frame)
+        with self._cond:
+            previous = self._source
+            self._frame = view
+            self._source = (frame, ring) if ring is not None else None
+            self._seq += 1
+            self._cond.notify_all()
+            for callback in self._listeners:
+                callback()
+            seq = self._seq
+        if previous is not None:
+            previous[1].release(previous[0])
+        return seq
+
+    @property
+    def seq(self):
+        """Sequence number of the newest frame."""
+        with self._cond:
+            return self._seq
+
+    def wait_for_jpeg(self, last_seq, params=DEFAULT_STREAM_PARAMS, timeout=STREAM_IDLE_RESEND_SECONDS):
+        """Blocks until a frame newer than last_seq exists (or timeout) and returns (seq, jpeg_bytes)
+        encoded for params, which the caller must have subscribed with."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq != last_seq, timeout=timeout)
+        return self.jpeg_for(params)
+
+    def jpeg_for(self, params=DEFAULT_STREAM_PARAMS):
+        """Returns (seq, jpeg_bytes) for the newest frame encoded with params, encoding it only if
+        no other client with the same params already has. The caller should be subscribed with params."""
+        with self._cond:
+            seq, frame, source = self._seq, self._frame, self._source
+            stream = self._streams.get(params)
+            if stream is None:
+                return seq, None  # Every client with these params has unsubscribed meanwhile
+            if source is not None:
+                source[1].retain(source[0])  # Held until the encode below is done with it
+
+        try:
+            with stream.lock:
+                if stream.seq < seq:
+                    start = time.perf_counter()
+                    jpeg = encode_jpeg(_resize_for_stream(frame, params), params.quality)
+                    if self._metrics is not None:
+                        self._metrics.observe('jpeg_encode', time.perf_counter() - start)
+                    if jpeg is None:
+                        return seq, None
+                    stream.jpeg = jpeg
+                    stream.seq = seq
+                return stream.seq, stream.jpeg
+        finally:
+            if source is not None:
+                source[1].release(source[0])
+
+
+class StageMetrics:
+    """Hot-path latency histograms, effective FPS, dropped frames and per-phase dwell time.
+
+    Histograms are cumulative Prometheus-style buckets, so observe() is a bucket scan and two
+    additions under a lock; FPS comes from the frame timestamps in the last FPS_WINDOW_SECONDS.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {stage: [[0] * len(LATENCY_BUCKETS), 0.0, 0] for stage in METRIC_STAGES}
+        self._frame_times = collections.deque()
+        self.frames_total = 0
+        self.dropped_frames = 0
+        self.phase_dwell = collections.defaultdict(float)
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            buckets, _, _ = histogram = self._histograms[stage]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    buckets[i] += 1
+                    break
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def frame_done(self, now, phase, frame_seconds):
+        """Counts a processed frame and charges frame_seconds of dwell to the phase it was in."""
+        with self._lock:
+            self.frames_total += 1
+            self.phase_dwell[phase] += frame_seconds
+            self._frame_times.append(now)
+            while self._frame_times[0] < now - FPS_WINDOW_SECONDS:
+                self._frame_times.popleft()
+
+    def add_dropped(self, count):
+        with self._lock:
+            self.dropped_frames += count
+
+    def fps(self):
+        with self._lock:
+            if len(self._frame_times) < 2:
+                return 0.0
+            span = self._frame_times[-1] - self._frame_times[0]
+            return (len(self._frame_times) - 1) / span if span > 0 else 0.0
+
+    def summary(self):
+        """Per-stage {count, mean_ms, p95_ms}; p95 is the upper bound of the bucket it falls in."""
+        with self._lock:
+            result = {}
+            for stage, (buckets, total, count) in self._histograms.items():
+                if not count:
+                    continue
+                p95_ms, cumulative = float('inf'), 0
+                for bound, bucket_count in zip(LATENCY_BUCKETS, buckets):
+                    cumulative += bucket_count
+                    if cumulative >= 0.95 * count:
+                        p95_ms = bound * 1000
+                        break
+                result[stage] = {"count": count, "mean_ms": total / count * 1000, "p95_ms": p95_ms}
+            return result
+
+    def collect(self, families, labels):
+        """Appends this session's samples to families: name -> (type, help, [(suffix, labels, value)])."""
+        fps = self.fps()
+        with self._lock:
+            for stage, (buckets, total, count) in self._histograms.items():
+                stage_labels = {**labels, "stage": stage}
+                samples = families.setdefault("proto_stage_latency_seconds", ("histogram", "Per-frame latency of each pipeline stage.", []))[2]
+                cumulative = 0
+                for bound, bucket_count in zip(LATENCY_BUCKETS, buckets):
+                    cumulative += bucket_count
+                    samples.append(("_bucket", {**stage_labels, "le": str(bound)}, cumulative))
+                samples.append(("_bucket", {**stage_labels, "le": "+Inf"}, count))
+                samples.append(("_sum", stage_labels, total))
+                samples.append(("_count", stage_labels, count))
+            families.setdefault("proto_frames_total", ("counter", "Frames run through the state machine.", []))[2].append(("", labels, self.frames_total))
+            families.setdefault("proto_dropped_frames_total", ("counter", "Frames captured but superseded before reaching the state machine.", []))[2].append(("", labels, self.dropped_frames))
+            dwell = families.setdefault("proto_phase_dwell_seconds_total", ("counter", "Wall-clock time spent in each protocol phase.", []))[2]
+            for phase, seconds in sorted(self.phase_dwell.items()):
+                dwell.append(("", {**labels, "phase": str(phase)}, seconds))
+        families.setdefault("proto_effective_fps", ("gauge", f"Frames processed per second over the last {FPS_WINDOW_SECONDS:g}s.", []))[2].append(("", labels, fps))
+
+
+def _escape_prometheus(text, quote=True):
+    """Escapes backslashes and newlines (and double quotes in label values) for the text format."""
+    text = str(text).replace('\\', '\\\\').replace('\n', '\\n')
+    return text.replace('"', '\\"') if quote else text
+
+
+def _format_prometheus(families):
+    """Renders {name: (type, help, [(suffix, labels, value)])} in the Prometheus text format."""
+    lines = []
+    for name, (metric_type, help_text, samples) in families.items():
+        lines.append(f"# HELP {name} {_escape_prometheus(help_text, quote=False)}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for suffix, labels, value in samples:
+            label_text = ",".join(f'{key}="{_escape_prometheus(val)}"' for key, val in labels.items())
+            lines.append(f"{name}{suffix}{{{label_text}}} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class StatusPublisher:
+    """Holds the latest protocol status snapshot and wakes /status_stream clients when it changes.
+
+    The protocol thread calls update() every frame; only snapshots that differ from the last
+    one bump the version, so clients receive an event per change rather than per frame.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._snapshot = None
+        self._version = 0
+        self._listeners = []  # Called (on the protocol thread) after every change
+
+    def add_listener(self, callback):
+        """Registers a no-argument callback run after every change; it must return quickly."""
+        with self._cond:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        with self._cond:
+            self._listeners.remove(callback)
+
+    def update(self, snapshot):
+        with self._cond:
+            if snapshot != self._snapshot:
+                self._snapshot = snapshot
+                self._version += 1
+                self._cond.notify_all()
+                for callback in self._listeners:
+                    callback()
+
+    def current(self):
+        """The latest (version, snapshot) without waiting."""
+        with self._cond:
+            return self._version, self._snapshot
+
+    def wait_for_change(self, last_version, timeout=STATUS_HEARTBEAT_SECONDS):
+        """Blocks until a snapshot newer than last_version exists (or timeout). Returns (version, snapshot)."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._version != last_version, timeout=timeout)
+            return self._version, self._snapshot
+
+
+# --- Detector Backends ---
+# Every backend is called as detector(images, imgsz=None) with a list of BGR images and returns
+# one DetectorOutput per image, with boxes in that image's pixel coordinates.
+DetectorOutput = collections.namedtuple('DetectorOutput', ['xyxy', 'conf', 'cls'])
+
+
+def detector_metadata_path(weights_path):
+    """Sidecar JSON written by export_model.py: class names, input size and export settings."""
+    if os.path.isdir(weights_path):
+        return os.path.join(weights_path, "detector.json")
+    return os.path.splitext(weights_path)[0] + ".json"
+
+
+def read_detector_metadata(weights_path):
+    try:
+        with open(detector_metadata_path(weights_path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def letterbox(image, size):
+    """Resizes image to fit size=(h, w) keeping its aspect ratio and pads the rest with gray.
+
+    Returns (padded, gain, (pad_x, pad_y)); a box in the padded image maps back to the original
+    as (x - pad_x) / gain, (y - pad_y) / gain.
+    """
+    h, w = image.shape[:2]
+    gain = min(size[0] / h, size[1] / w)
+    new_h, new_w = round(h * gain), round(w * gain)
+    if (new_h, new_w) != (h, w):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    pad_y, pad_x = (size[0] - new_h) // 2, (size[1] - new_w) // 2
+    padded = np.full((size[0], size[1], 3), 114, dtype=np.uint8)
+    padded[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = image
+    return padded, gain, (pad_x, pad_y)
+
+
+def nms(boxes, scores, iou_threshold):
+    """Greedy non-maximum suppression on (N, 4) xyxy boxes. Returns kept indices, best first."""
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1) * (y2 - y1)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size:
+        best, rest = order[0], order[1:]
+        keep.append(best)
+        inter_w = np.clip(np.minimum(x2[best], x2[rest]) - np.maximum(x1[best], x1[rest]), 0, None)
+        inter_h = np.clip(np.minimum(y2[best], y2[rest]) - np.maximum(y1[best], y1[rest]), 0, None)
+        inter = inter_w * inter_h
+        order = rest[inter / (areas[best] + areas[rest] - inter + 1e-9) <= iou_threshold]
+    return np.array(keep, dtype=np.intp)
+
+
+def postprocess_yolo(prediction, gain, pad, image_shape, conf_threshold=DETECTOR_CONF, iou_threshold=DETECTOR_IOU):
+    """Decodes one image's raw YOLOv8/11 head output, shaped (4 + n_classes, n_anchors), into a DetectorOutput.
+
+    Rows are (cx, cy, w, h, class scores...) in letterboxed pixels. NMS is per class, as in ultralytics.
+    """
+    scores = prediction[4:]
+    cls = scores.argmax(axis=0)
+    conf = scores[cls, np.arange(cls.size)]
+    candidates = conf >= conf_threshold
+    cls, conf = cls[candidates], conf[candidates]
+    cx, cy, w, h = prediction[:4, candidates]
+    boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+
+    # Offsetting each class far apart lets one NMS pass keep classes from suppressing each other
+    keep = nms(boxes + cls[:, None] * 4096.0, conf, iou_threshold)[:DETECTOR_MAX_DETECTIONS]
+    boxes, conf, cls = boxes[keep], conf[keep], cls[keep]
+
+    boxes -= (pad[0], pad[1], pad[0], pad[1])
+    boxes /= gain
+    boxes[:, 0::2] = boxes[:, 0::2].clip(0, image_shape[1])
+    boxes[:, 1::2] = boxes[:, 1::2].clip(0, image_shape[0])
+    return DetectorOutput(boxes.astype(np.float32), conf.astype(np.float32), cls.astype(np.intp))
+
+
+def target_class_ids(class_names):
+    """The model's class id for each of TARGET_CLASSES, -1 where the model lacks that class."""
+    ids = {name: i for i, name in enumerate(class_names)}
+    return [ids.get(label, -1) for label in TARGET_CLASSES]
+
+
+def select_class_boxes(output, target_ids, offset=(0, 0), top_k=DETECTION_TOP_K):
+    """Picks the top_k boxes of each target class from a DetectorOutput with NumPy reductions.
+
+    Boxes are shifted by offset (the ROI origin) and converted to integer (cx, cy, w, h).
+    Returns {label: [(conf, (cx, cy, w, h)), ...]}, best first, for the classes found; ties
+    keep the detector's order. Outputs under SMALL_OUTPUT_BOXES take _select_few_boxes instead.
+    """
+    if not len(output.conf):
+        return {}
+    if len(output.conf) < SMALL_OUTPUT_BOXES:
+        return _select_few_boxes(output, target_ids, offset, top_k)
+    order = np.argsort(-output.conf, kind='stable')
+    sorted_cls = output.cls[order]
+    ox, oy = offset
+    selected = {}
+    for label, class_id in zip(TARGET_CLASSES, target_ids):
+        if class_id < 0:
+            continue
+        idx = order[sorted_cls == class_id][:top_k]
+        if not idx.size:
+            continue
+        xyxy = output.xyxy[idx].astype(np.int64) + (ox, oy, ox, oy)
+        w, h = xyxy[:, 2] - xyxy[:, 0], xyxy[:, 3] - xyxy[:, 1]
+        boxes = zip((xyxy[:, 0] + w // 2).tolist(), (xyxy[:, 1] + h // 2).tolist(), w.tolist(), h.tolist())
+        selected[label] = list(zip(output.conf[idx].tolist(), boxes))
+    return selected
+
+
+def _select_few_boxes(output, target_ids, offset, top_k):
+    """select_class_boxes for a handful of boxes: one tolist() per array and a Python loop, same result."""
+    labels = {class_id: label for label, class_id in zip(TARGET_CLASSES, target_ids) if class_id >= 0}
+    conf, cls, xyxy = output.conf.tolist(), output.cls.tolist(), output.xyxy.tolist()
+    ox, oy = offset
+    selected = {}
+    for i in sorted(range(len(conf)), key=lambda i: -conf[i]):
+        label = labels.get(cls[i])
+        if label is None:
+            continue
+        boxes = selected.setdefault(label, [])
+        if len(boxes) < top_k:
+            x1, y1, x2, y2 = int(xyxy[i][0]) + ox, int(xyxy[i][1]) + oy, int(xyxy[i][2]) + ox, int(xyxy[i][3]) + oy
+            w, h = x2 - x1, y2 - y1
+            boxes.append((conf[i], (x1 + w // 2, y1 + h // 2, w, h)))
+    return {label: selected[label] for label in TARGET_CLASSES if label in selected}
+
+
+class UltralyticsDetector:
+    """The original path: ultralytics.YOLO does its own preprocessing and NMS (any format it loads)."""
+    backend = "ultralytics"
+
+    def __init__(self, weights_path):
+        from ultralytics import YOLO  # Imported here so importing proto does not pull in torch
+        self.model = YOLO(weights_path)
+        names = self.model.names
+        self.names = [names[i] for i in sorted(names)] if isinstance(names, dict) else list(names)
+
+    def __call__(self, images, imgsz=None):
+        results = self.model(images, verbose=False, conf=DETECTOR_CONF, iou=DETECTOR_IOU, **({'imgsz': imgsz} if imgsz else {}))
+        return [DetectorOutput(result.boxes.xyxy.cpu().numpy(), result.boxes.conf.cpu().numpy(),
+                               result.boxes.cls.cpu().numpy().astype(np.intp)) for result in results]
+
+
+class ExportedDetector:
+    """Shared letterbox / NumPy NMS wrapper for exported models; subclasses only run the graph.
+
+    Models exported with dynamic axes take any imgsz (and batch several images in one run);
+    static models are always fed their own input size.
+    """
+    backend = None
+
+    def __init__(self, weights_path, input_shape):
+        metadata = read_detector_metadata(weights_path)
+        self.names = metadata.get("names") or self._embedded_names()
+        if not self.names:
+            raise ValueError(f"No class names for {weights_path}; export it with export_model.py")
+        self.imgsz = metadata.get("imgsz", DETECTOR_IMGSZ)
+        batch, _, height, width = input_shape
+        self.fixed_size = (height, width) if isinstance(height, int) and isinstance(width, int) else None
+        self.fixed_batch = isinstance(batch, int)
+
+    def _embedded_names(self):
+        return None
+
+    def _forward(self, blob):
+        raise NotImplementedError
+
+    def __call__(self, images, imgsz=None):
+        size = self.fixed_size or (imgsz or self.imgsz,) * 2
+        letterboxed = [letterbox(image, size) for image in images]
+        blob = np.stack([padded for padded, _, _ in letterboxed])[..., ::-1].transpose(0, 3, 1, 2)
+        blob = np.ascontiguousarray(blob, dtype=np.float32)
+        blob *= 1 / 255.0
+        if self.fixed_batch and len(images) > 1:
+            predictions = np.concatenate([self._forward(blob[i:i + 1]) for i in range(len(images))])
+        else:
+            predictions = self._forward(blob)
+        return [postprocess_yolo(prediction, gain, pad, image.shape)
+                for prediction, image, (_, gain, pad) in zip(predictions, images, letterboxed)]
+
+
+class OnnxRuntimeDetector(ExportedDetector):
+    """ONNX Runtime (CPU by default, see ONNX_PROVIDERS); also runs the INT8 models from export_model.py."""
+    backend = "onnxruntime"
+
+    def __init__(self, weights_path):
+        import onnxruntime
+        self.session = onnxruntime.InferenceSession(weights_path, providers=list(ONNX_PROVIDERS))
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        super().__init__(weights_path, model_input.shape)
+
+    def _embedded_names(self):
+        # ultralytics stores the names dict's repr in the ONNX metadata
+        names = self.session.get_modelmeta().custom_metadata_map.get("names")
+        if names:
+            import ast
+            names = ast.literal_eval(names)
+            return [names[i] for i in sorted(names)]
+        return None
+
+    def _forward(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+
+class OpenVinoDetector(ExportedDetector):
+    """OpenVINO runtime on OPENVINO_DEVICE; takes the .xml or the *_openvino_model directory."""
+    backend = "openvino"
+
+    def __init__(self, weights_path):
+        import openvino
+        xml_path = weights_path
+        if os.path.isdir(weights_path):
+            xml_path = next(os.path.join(weights_path, name) for name in sorted(os.listdir(weights_path)) if name.endswith('.xml'))
+        core = openvino.Core()
+        model = core.read_model(xml_path)
+        self.compiled = core.compile_model(model, OPENVINO_DEVICE)
+        self.output = self.compiled.output(0)
+        shape = model.input(0).get_partial_shape()
+        super().__init__(weights_path, [dim.get_length() if dim.is_static else None for dim in shape])
+
+    def _forward(self, blob):
+        return self.compiled(blob)[self.output]
+
+
+DETECTOR_BACKENDS = {detector.backend: detector for detector in (UltralyticsDetector, OnnxRuntimeDetector, OpenVinoDetector)}
+
+
+def resolve_detector_backend(weights_path, backend=None):
+    """The backend name load_detector would use. backend=None means DETECTOR_BACKEND."""
+    backend = backend or DETECTOR_BACKEND
+    if backend == "auto":
+        if weights_path.endswith('.onnx'):
+            backend = "onnxruntime"
+        elif weights_path.endswith('.xml') or weights_path.rstrip('/\\').endswith('_openvino_model'):
+            backend = "openvino"
+        else:
+            backend = "ultralytics"
+    if backend not in DETECTOR_BACKENDS:
+        raise ValueError(f"Unknown detector backend {backend!r}; expected one of {sorted(DETECTOR_BACKENDS)}")
+    return backend
+
+
+def load_detector(weights_path, backend=None):
+    """Returns a detector for weights_path. backend=None uses DETECTOR_BACKEND ("auto" picks by file type)."""
+    return DETECTOR_BACKENDS[resolve_detector_backend(weights_path, backend)](weights_path)
+
+
+class BatchedInferenceServer:
+    """Collects frames from many sessions and runs them through one detector in micro-batches.
+
+    infer() queues a frame and blocks until its result is ready. A single worker thread takes
+    the oldest request, keeps collecting until BATCH_MAX_SIZE frames are queued or the oldest
+    has waited BATCH_MAX_WAIT_MS, then runs one forward pass per distinct imgsz in the batch.
+    Sessions register() only while a session is running (not while they wait for /reset or
+    reopen the camera); each has at most one frame in flight, so a batch also goes as soon as every registered session has queued one (at once with a single
+    session) rather than waiting out the window for frames that cannot arrive.
+    """
+
+    def __init__(self, model, model_lock, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS):
+        self.model = model
+        self.model_lock = model_lock
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._requests = queue.Queue()
+        self._producers = 0  # Registered sessions; 0 means unknown, so batches wait out the window
+        self._stats_lock = threading.Lock()
+        self.batch_sizes = collections.deque(maxlen=BATCH_STATS_WINDOW)
+        self.queue_waits = collections.deque(maxlen=BATCH_STATS_WINDOW * max_batch_size)
+        self.batches_run = 0
+        self.frames_run = 0
+        self.queue_wait_seconds_total = 0.0
+        self._worker = threading.Thread(target=self._serve, daemon=True, name='yolo-batcher')
+        self._worker.start()
+
+    def infer(self, image, imgsz=None):
+        """Returns the DetectorOutput for image, run as part of the next micro-batch."""
+        future = Future()
+        self._requests.put((image, imgsz, future, time.perf_counter()))
+        return future.result()
+
+    def register(self):
+        """Counts one more session submitting frames."""
+        with self._stats_lock:
+            self._producers += 1
+
+    def unregister(self):
+        with self._stats_lock:
+            self._producers = max(0, self._producers - 1)
+
+    def _collect_batch(self):
+        batch = [self._requests.get()]
+        deadline = batch[0][3] + self.max_wait
+        with self._stats_lock:
+            batch_size = min(self.max_batch_size, self._producers or self.max_batch_size)
+        while len(batch) < batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._requests.get(timeout=remaining) if remaining > 0 else self._requests.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _serve(self):
+        while True:
+            batch = self._collect_batch()
+            started = time.perf_counter()
+
+            # Frames at different input sizes cannot share a forward pass
+            groups = collections.defaultdict(list)
+            for item in batch:
+                groups[item[1]].append(item)
+
+            for imgsz, items in groups.items():
+                try:
+                    with self.model_lock:
+                        results = self.model([item[0] for item in items], imgsz)
+                    for item, result in zip(items, results):
+                        item[2].set_result(result)
+                except Exception as e:
+                    for item in items:
+                        item[2].set_exception(e)
+
+            with self._stats_lock:
+                self.batches_run += 1
+                self.frames_run += len(batch)
+                self.batch_sizes.append(len(batch))
+                waits = [started - item[3] for item in batch]
+                self.queue_waits.extend(waits)
+                self.queue_wait_seconds_total += sum(waits)
+
+    def stats(self):
+        """Summarizes recent batch sizes and queue waits for tuning BATCH_MAX_SIZE / BATCH_MAX_WAIT_MS."""
+        with self._stats_lock:
+            sizes = list(self.batch_sizes)
+            waits = sorted(self.queue_waits)
+            batches_run, frames_run = self.batches_run, self.frames_run
+            queue_wait_seconds_total = self.queue_wait_seconds_total
+
+        def percentile(q):
+            return waits[min(len(waits) - 1, int(q * len(waits)))] * 1000 if waits else 0.0
+
+        return {
+            "batches_run": batches_run,
+            "frames_run": frames_run,
+            "queue_depth": self._requests.qsize(),
+            "max_batch_size": self.max_batch_size,
+            "producers": self._producers,
+            "max_wait_ms": self.max_wait * 1000,
+            "mean_batch_size": sum(sizes) / len(sizes) if sizes else 0.0,
+            "batch_size_counts": dict(collections.Counter(sizes)),
+            "queue_wait_ms": {"p50": percentile(0.5), "p95": percentile(0.95), "max": percentile(1.0)},
+            "queue_wait_seconds_total": queue_wait_seconds_total,
+        }
+
+
+def save_detection_cache(path, detection_log, **metadata):
+    """Writes per-frame detections dicts to a compressed .npz with one fixed-layout array per field.
+
+    Stores class confidences and boxes for TARGET_CLASSES, jaw distance, the tracked flag and the
+    mouth landmarks (MOUTH_ROI_LANDMARK_IDS) - everything the state machine reads - plus metadata.
+    """
+    n, n_classes, n_landmarks = len(detection_log), len(TARGET_CLASSES), len(MOUTH_ROI_LANDMARK_IDS)
+    conf = np.zeros((n, n_classes), dtype=np.float32)
+    boxes = np.zeros((n, n_classes, 4), dtype=np.int32)
+    has_box = np.zeros((n, n_classes), dtype=bool)
+    jaw_distance = np.zeros(n, dtype=np.float32)
+    has_face = np.zeros(n, dtype=bool)
+    landmarks = np.zeros((n, n_landmarks, 3), dtype=np.float32)
+    tracked = np.zeros(n, dtype=bool)
+
+    for i, detections in enumerate(detection_log):
+        for j, cls in enumerate(TARGET_CLASSES):
+            cls_conf, bbox = detections.get(cls, (0.0, None))
+            conf[i, j] = cls_conf
+            if bbox is not None:
+                boxes[i, j] = bbox
+                has_box[i, j] = True
+        jaw_distance[i] = detections.get('jaw_distance', 0.0)
+        tracked[i] = detections.get('tracked', False)
+        lip_landmarks = detections.get('lip_landmarks')
+        if lip_landmarks is not None:
+            has_face[i] = True
+            for k, landmark_id in enumerate(MOUTH_ROI_LANDMARK_IDS):
+                point = lip_landmarks[landmark_id]
+                landmarks[i, k] = (point.x, point.y, point.z)
+
+    np.savez_compressed(
+        path, version=DETECTION_CACHE_VERSION, classes=np.array(TARGET_CLASSES),
+        landmark_ids=np.array(MOUTH_ROI_LANDMARK_IDS), conf=conf, boxes=boxes, has_box=has_box,
+        jaw_distance=jaw_distance, has_face=has_face, landmarks=landmarks, tracked=tracked,
+        metadata=json.dumps(metadata)
+    )
+
+
+def load_detection_cache(path):
+    """Reads a save_detection_cache file back into (list of detections dicts, metadata dict).
+
+    lip_landmarks comes back as {landmark_id: point} holding only the cached mouth landmarks,
+    which is all the state machine and overlays index into.
+    """
+    with np.load(path) as cache:
+        if int(cache['version']) != DETECTION_CACHE_VERSION:
+            raise ValueError(f"{path}: detection cache version {int(cache['version'])}, expected {DETECTION_CACHE_VERSION}")
+        classes = [str(cls) for cls in cache['classes']]
+        landmark_ids = [int(i) for i in cache['landmark_ids']]
+        conf, boxes, has_box = cache['conf'], cache['boxes'], cache['has_box']
+        jaw_distance, has_face, landmarks, tracked = cache['jaw_distance'], cache['has_face'], cache['landmarks'], cache['tracked']
+        metadata = json.loads(str(cache['metadata']))
+
+    detection_log = []
+    for i in range(len(conf)):
+        detections = {
+            cls: (float(conf[i, j]), tuple(int(v) for v in boxes[i, j]) if has_box[i, j] else None)
+            for j, cls in enumerate(classes)
+        }
+        detections['jaw_distance'] = float(jaw_distance[i])
+        detections['lip_landmarks'] = {
+            landmark_id: types.SimpleNamespace(x=float(x), y=float(y), z=float(z))
+            for landmark_id, (x, y, z) in zip(landmark_ids, landmarks[i])
+        } if has_face[i] else None
+        if tracked[i]:
+            detections['tracked'] = True
+        detection_log.append(detections)
+    return detection_log, metadata
+
+
+class ReportWriter:
+    """Appends session reports to daily JSON Lines files from a background thread.
+
+    submit() only queues the report, so the protocol thread never touches the disk. The writer
+    flushes in batches (REPORT_BATCH_SIZE reports or every REPORT_FLUSH_SECONDS) and keeps a
+    rollup index - first/last timestamp, count, verdict counts and byte size per file - in
+    index.json so query(since=...) only opens the files that can contain matching reports. An
+    entry whose size no longer matches its file (a crash between the append and the index
+    write) is rebuilt from the file on load. Reports that fail to write stay queued and are
+    retried with the next flush.
+    """
+
+    def __init__(self, report_dir=REPORT_DIR):
+        self.report_dir = report_dir
+        self.index_path = os.path.join(report_dir, "index.json")
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()  # Guards _index and _pending, which query() also reads
+        self._index = None
+        self._pending = []
+        self._thread = None
+        self._seq = 0
+
+    def submit(self, report):
+        """Queues a report for writing and returns at once. Adds a unique report_id."""
+        with self._lock:
+            self._seq += 1
+            report["report_id"] = f"{report['ended_at']}-{report.get('session_id', '')}-{self._seq}"
+            self._pending.append(report)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name='report-writer')
+                self._thread.start()
+        self._queue.put(report)
+
+    def close(self):
+        """Writes whatever is still queued. Called at interpreter exit."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=5.0)
+
+    def _run(self):
+        self._load_index()
+        stopping = False
+        unwritten = []
+        while not stopping:
+            batch, unwritten = unwritten, []
+            try:
+                batch.append(self._queue.get(timeout=REPORT_FLUSH_SECONDS))
+                while len(batch) < REPORT_BATCH_SIZE:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if None in batch:
+                stopping = True
+                batch = [report for report in batch if report is not None]
+            if batch:
+                unwritten = self._write_batch(batch)
+        if unwritten:
+            print(f"❌ ERROR: {len(unwritten)} protocol report(s) could not be saved before exit")
+
+    def _write_batch(self, batch):
+        """Appends batch to the daily files and rewrites the index. Returns the reports not appended."""
+        by_file = collections.defaultdict(list)
+        for report in batch:
+            by_file[f"adherence_{report['ended_at'][:10].replace('-', '')}.jsonl"].append(report)
+
+        written = []
+        try:
+            os.makedirs(self.report_dir, exist_ok=True)
+            for filename, reports in by_file.items():
+                with open(os.path.join(self.report_dir, filename), 'a+b') as f:
+                    lines = ''.join(json.dumps(report) + '\n' for report in reports).encode()
+                    size = f.seek(0, os.SEEK_END)
+                    if size and (f.seek(size - 1), f.read(1))[1] != b'\n':
+                        lines = b'\n' + lines  # Finish a line cut short by an earlier failed write
+                    f.write(lines)
+                    f.flush()
+                    size = f.tell()
+                written.extend(reports)
+                with self._lock:
+                    for report in reports:
+                        self._index_report(filename, report)
+                    self._index[filename]["size"] = size
+            with self._lock:
+                index_snapshot = json.dumps(self._index, indent=4)
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(index_snapshot)
+            os.replace(tmp_path, self.index_path)
+            print(f"✅ {len(batch)} protocol report(s) saved to {self.report_dir}")
+        except OSError as e:
+            print(f"❌ ERROR: Could not save protocol reports, retrying in {REPORT_FLUSH_SECONDS:g}s. Reason: {e}")
+        finally:
+            # Appended reports are on disk even if the index write failed: load rebuilds the index
+            with self._lock:
+                done = {id(report) for report in written}
+                self._pending = [report for report in self._pending if id(report) not in done]
+        return [report for report in batch if id(report) not in done]
+
+    def _index_report(self, filename, report):
+        entry = self._index.setdefault(filename, {"first": report["ended_at"], "last": report["ended_at"], "count": 0, "final_status": {}})
+        entry["first"] = min(entry["first"], report["ended_at"])
+        entry["last"] = max(entry["last"], report["ended_at"])
+        entry["count"] += 1
+        entry["final_status"][report["final_status"]] = entry["final_status"].get(report["final_status"], 0) + 1
+
+    def _load_index(self):
+        """Loads index.json and rebuilds the entries of any .jsonl file whose size does not match
+        its entry (all of them if the index is missing or unreadable)."""
+        index = None
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            pass
+        sizes = {}
+        if os.path.isdir(self.report_dir):
+            for filename in os.listdir(self.report_dir):
+                if filename.endswith('.jsonl'):
+                    sizes[filename] = os.path.getsize(os.path.join(self.report_dir, filename))
+        with self._lock:
+            self._index = {filename: entry for filename, entry in (index or {}).items() if filename in sizes}
+            for filename, size in sorted(sizes.items()):
+                if self._index.get(filename, {}).get("size") == size:
+                    continue
+                self._index.pop(filename, None)
+                for report in self._read_file(filename):
+                    self._index_report(filename, report)
+                if filename in self._index:
+                    self._index[filename]["size"] = size
+
+    def _read_file(self, filename):
+        """The reports in one .jsonl file, skipping lines that do not parse (an interrupted write)."""
+        reports = []
+        try:
+            with open(os.path.join(self.report_dir, filename)) as f:
+                for line in f:
+                    try:
+                        reports.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except OSError:
+            pass
+        return reports
+
+    def rollup(self):
+        """Per-file first/last timestamp, report count and verdict counts."""
+        if self._index is None:
+            self._load_index()
+        with self._lock:
+            return json.loads(json.dumps(self._index))
+
+    def query(self, since=None, until=None, session_id=None, limit=None):
+        """Reports with since <= ended_at <= until (ISO strings), oldest first, including queued ones."""
+        index = self.rollup()
+        reports = []
+        for filename, entry in sorted(index.items()):
+            if (since and entry["last"] < since) or (until and entry["first"] > until):
+                continue
+            reports.extend(self._read_file(filename))
+        with self._lock:
+            reports.extend(self._pending)
+
+        seen, matches = set(), []
+        for report in sorted(reports, key=lambda report: report["ended_at"]):
+            report_id = report.get("report_id")
+            if report_id is not None:  # Reports written before report_id existed are all kept
+                if report_id in seen:
+                    continue
+                seen.add(report_id)
+            if (since and report["ended_at"] < since) or (until and report["ended_at"] > until):
+                continue
+            if session_id and report.get("session_id") != session_id:
+                continue
+            matches.append(report)
+        return matches[-limit:] if limit else matches
+
+
+report_writer = ReportWriter()
+atexit.register(report_writer.close)
+
+
+class EvidenceRecorder:
+    """Writes one session's annotated frames to a compressed video and keyframes to JPEGs.
+
+    record_frame() queues a downscaled copy and keyframe() a full-resolution copy, so neither
+    holds on to the reused capture buffers; a background encoder thread does the encoding and
+    disk writes. Both queues are bounded, and a full queue drops the new frame (counted in the
+    manifest) rather than blocking the protocol thread. finish() drains the queues and writes
+    manifest.json next to the video.
+
+    Each session gets its own directory, created exclusively: a session started within the same
+    millisecond as an earlier one (a quick /reset, back-to-back replays) gets a numbered suffix
+    instead of overwriting the earlier session's evidence.
+    """
+
+    def __init__(self, session_id, started_at, evidence_dir=EVIDENCE_DIR):
+        safe_id = ''.join(c if c.isalnum() or c in '-_' else '_' for c in session_id)
+        self.path = self._create_dir(evidence_dir, f"{safe_id}_{started_at.strftime('%Y%m%d_%H%M%S_%f')[:-3]}")
+        self.session_id = session_id
+        self._cond = threading.Condition()
+        self._frames = collections.deque()
+        self._keyframes = collections.deque()
+        self._finished = False
+        self._next_frame_at = 0.0
+        self._writer = None
+        self.keyframes = []
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.keyframes_dropped = 0
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f'evidence-{session_id}')
+        self._thread.start()
+
+    @staticmethod
+    def _create_dir(evidence_dir, name):
+        """Creates evidence_dir/name, or name_2, name_3, ... if it exists. Returns the path."""
+        os.makedirs(evidence_dir, exist_ok=True)
+        path, attempt = os.path.join(evidence_dir, name), 1
+        while True:
+            try:
+                os.mkdir(path)
+                return path
+            except FileExistsError:
+                attempt += 1
+                path = os.path.join(evidence_dir, f"{name}_{attempt}")
+
+    def record_frame(self, frame, frame_time):
+        """Queues a frame for the evidence video, keeping at most EVIDENCE_FPS per second of frame_time.
+
+        frame_time is the protocol's elapsed frame time, not the wall clock, so a replay that runs
+        faster than real time still keeps EVIDENCE_FPS frames per second of the clip.
+        """
+        if frame_time < self._next_frame_at:
+            return
+        self._next_frame_at = frame_time + 1.0 / EVIDENCE_FPS
+        if len(self._frames) >= EVIDENCE_QUEUE_SIZE:
+            with self._cond:
+                self.frames_dropped += 1
+            return
+        height, width = frame.shape[:2]
+        if width > EVIDENCE_MAX_WIDTH:
+            height, width = int(height * EVIDENCE_MAX_WIDTH / width) // 2 * 2, EVIDENCE_MAX_WIDTH
+            frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+        else:
+            frame = frame.copy()
+        with self._cond:
+            self._frames.append(frame)
+            self._cond.notify()
+
+    def keyframe(self, frame, label, frame_index):
+        """Queues a full-resolution still, e.g. at a phase transition or a fatal failure."""
+        with self._cond:
+            if len(self._keyframes) >= EVIDENCE_KEYFRAME_QUEUE_SIZE:
+                self.keyframes_dropped += 1
+                return
+            self._keyframes.append((frame.copy(), label, frame_index))
+            self._cond.notify()
+
+    def finish(self, result_status):
+        """Tells the encoder to flush, close the video and write the manifest. Returns the evidence dir.
+
+        Does not wait for the encoder; join() does.
+        """
+        with self._cond:
+            self._finished = True
+            self.result_status = result_status
+            self._cond.notify()
+        return self.path
+
+    def join(self, timeout=10.0):
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._frames and not self._keyframes and not self._finished:
+                    self._cond.wait()
+                keyframes = list(self._keyframes)
+                self._keyframes.clear()
+                frames = list(self._frames)
+                self._frames.clear()
+                finished = self._finished
+            try:
+                for frame, label, frame_index in keyframes:
+                    self._write_keyframe(frame, label, frame_index)
+                for frame in frames:
+                    self._write_frame(frame)
+            except (OSError, cv2.error) as e:
+                print(f"❌ ERROR: Could not write evidence for session {self.session_id}. Reason: {e}")
+            if finished:
+                break
+        if self._writer is not None:
+            self._writer.release()
+        self._write_manifest()
+
+    def _write_keyframe(self, frame, label, frame_index):
+        filename = f"{len(self.keyframes):02d}_frame{frame_index:06d}_{label}.jpg"
+        cv2.imwrite(os.path.join(self.path, filename), frame, [cv2.IMWRITE_JPEG_QUALITY, EVIDENCE_JPEG_QUALITY])
+        self.keyframes.append({"file": filename, "label": label, "frame": frame_index})
+
+    def _write_frame(self, frame):
+        height, width = frame.shape[:2]
+        if self._writer is None:
+            fourcc = cv2.VideoWriter_fourcc(*EVIDENCE_FOURCC)
+            self._writer = cv2.VideoWriter(os.path.join(self.path, "session.mp4"), fourcc, EVIDENCE_FPS, (width, height))
+        self._writer.write(frame)
+        self.frames_written += 1
+
+    def _write_manifest(self):
+        manifest = {
+            "session_id": self.session_id,
+            "final_status": getattr(self, 'result_status', None),
+            "video": "session.mp4" if self.frames_written else None,
+            "video_fps": EVIDENCE_FPS,
+            "frames_written": self.frames_written,
+            "frames_dropped": self.frames_dropped,
+            "keyframes": self.keyframes,
+            "keyframes_dropped": self.keyframes_dropped,
+        }
+        try:
+            with open(os.path.join(self.path, "manifest.json"), 'w') as f:
+                json.dump(manifest, f, indent=4)
+            print(f"✅ Evidence for session {self.session_id} saved to {self.path}")
+        except OSError as e:
+            print(f"❌ ERROR: Could not save evidence manifest. Reason: {e}")
+
+
+# --- Protocol State Machine ---
+TRANSITION_NONE, TRANSITION_ADVANCE, TRANSITION_FINISH = 0, 1, 2
+STATUS_AWAITING, STATUS_ADVANCED, STATUS_HOLD_PILL, STATUS_PILL_MOVING, STATUS_HOLD_CLOSE, STATUS_FINAL_CHECK, STATUS_SWALLOW_FAIL, STATUS_PASS = range(8)
+ALERT_NONE, ALERT_PILL_NOT_DETECTED, ALERT_OPEN_WIDER, ALERT_PLACE_PILL, ALERT_CLOSE_MOUTH, ALERT_REOPEN_MOUTH, ALERT_SWALLOW = range(7)
+WARNING_NONE, WARNING_MEDICATION_MISSING, WARNING_OPENED_EARLY = range(3)
+ISSUE_TONGUE_VISIBLE, ISSUE_JAW_OPEN, ISSUE_MOUTH_CLOSED, ISSUE_PILL_VISIBLE = 1, 2, 4, 8
+
+PHASE_PROMPTS = {
+    1: "PHASE 1: Hold medication up.",
+    2: "PHASE 2: Open mouth WIDE (Check).",
+    3: "PHASE 3: Place pill on your tongue.",
+    4: "PHASE 4: Close mouth (Check).",
+    5: "PHASE 5: Open mouth for check.",
+    6: "PHASE 6: SWALLOW CHECK..."
+}
+ADVANCE_TEXTS = {
+    1: "SUCCESS: Pill Detected. Advancing...",
+    2: "SUCCESS: Mouth Wide Open. Advancing...",
+    3: "SUCCESS: Pill Stable (Duration Met). Advancing...",
+    4: "SUCCESS: Mouth Closed. Advancing...",
+    5: "SUCCESS: Re-opened mouth. Checking swallow..."
+}
+WARNING_TEXTS = {
+    WARNING_MEDICATION_MISSING: "MEDICATION MISSING (Resetting P4)",
+    WARNING_OPENED_EARLY: "Mouth Opened Too Early!"
+}
+
+
+class DetectionRecord:
+    """Compact per-frame input to ProtocolStateMachine.step: just the fields the phases read.
+
+    One instance is refilled every frame with load(), so stepping allocates nothing per frame.
+    """
+    __slots__ = ('pill_conf', 'pill_on_tongue_conf', 'pill_on_tongue_cx', 'pill_on_tongue_cy',
+                 'has_pill_on_tongue_box', 'tongue_conf', 'jaw_distance', 'face_found', 'tracked', 'dt')
+
+    def __init__(self):
+        self.pill_conf = 0.0
+        self.pill_on_tongue_conf = 0.0
+        self.pill_on_tongue_cx = 0
+        self.pill_on_tongue_cy = 0
+        self.has_pill_on_tongue_box = False
+        self.tongue_conf = 0.0
+        self.jaw_distance = 0.0
+        self.face_found = False
+        self.tracked = False
+        self.dt = 0.0
+
+    def load(self, detections, dt):
+        """Refills this record from a _yolo_detect-style detections dict. Returns self.
+
+        dt is the frame time in seconds (since the previous frame) credited to the hold timers.
+        """
+        self.dt = dt
+        self.pill_conf = detections.get('pill', (0.0, None))[0]
+        self.pill_on_tongue_conf, bbox = detections.get('pill-on-tongue', (0.0, None))
+        self.has_pill_on_tongue_box = bbox is not None
+        if bbox is not None:
+            self.pill_on_tongue_cx, self.pill_on_tongue_cy = bbox[0], bbox[1]
+        self.tongue_conf = detections.get('tongue-no-pill', (0.0, None))[0]
+        self.jaw_distance = detections.get('jaw_distance', 0.0)
+        self.face_found = detections.get('lip_landmarks') is not None
+        self.tracked = detections.get('tracked', False)
+        return self
+
+
+class CentroidWindow:
+    """Preallocated NumPy ring buffer of pill centroids over a sliding window of elapsed time.
+
+    Each centroid is stored with its frame time; the oldest ones are dropped as soon as the rest
+    still cover window_seconds. The buffer is sized for initial_fps and doubles if a faster source
+    fills it before it covers the window, so full is reached at any frame rate. Running sums keep
+    append() and spread() O(1) whatever the frame rate. Centroids are whole pixels and frame times
+    whole microseconds, summed as Python ints, so adding and removing samples never accumulates
+    rounding error.
+    """
+    __slots__ = ('_points', '_dts', '_size', '_window_us', '_next', '_count', '_duration_us',
+                 '_sum_x', '_sum_y', '_sum_xx', '_sum_yy')
+
+    def __init__(self, window_seconds, initial_fps=CENTROID_WINDOW_INITIAL_FPS):
+        self._size = math.ceil(window_seconds * initial_fps) + 1
+        self._points = np.zeros((self._size, 2), dtype=np.int64)
+        self._dts = np.zeros(self._size, dtype=np.int64)
+        self._window_us = round((window_seconds - TIMER_TOLERANCE_SECONDS) * 1e6)
+        self.clear()
+
+    def __len__(self):
+        return self._count
+
+    def clear(self):
+        self._next = 0
+        self._count = 0
+        self._duration_us = 0
+        self._sum_x = self._sum_y = self._sum_xx = self._sum_yy = 0
+
+    @property
+    def duration(self):
+        """Seconds of frame time covered by the buffered centroids."""
+        return self._duration_us / 1e6
+
+    @property
+    def full(self):
+        return self._duration_us >= self._window_us
+
+    def _drop_oldest(self):
+        oldest = (self._next - self._count) % self._size
+        old_x, old_y = self._points[oldest].tolist()
+        self._sum_x -= old_x; self._sum_y -= old_y
+        self._sum_xx -= old_x * old_x; self._sum_yy -= old_y * old_y
+        self._duration_us -= int(self._dts[oldest])
+        self._count -= 1
+
+    def _grow(self):
+        """Doubles the buffer, keeping the centroids in order (oldest at index 0)."""
+        order = (np.arange(self._count) + self._next - self._count) % self._size
+        self._size *= 2
+        points = np.zeros((self._size, 2), dtype=np.int64)
+        dts = np.zeros(self._size, dtype=np.int64)
+        points[:self._count] = self._points[order]
+        dts[:self._count] = self._dts[order]
+        self._points, self._dts, self._next = points, dts, self._count
+
+    def append(self, x, y, dt):
+        x, y, dt_us = int(x), int(y), round(dt * 1e6)
+        if self._count == self._size:
+            self._grow()
+        self._points[self._next] = (x, y)
+        self._dts[self._next] = dt_us
+        self._sum_x += x; self._sum_y += y
+        self._sum_xx += x * x; self._sum_yy += y * y
+        self._duration_us += dt_us
+        self._count += 1
+        self._next = (self._next + 1) % self._size
+        while self._count > 1 and self._duration_us - int(self._dts[(self._next - self._count) % self._size]) >= self._window_us:
+            self._drop_oldest()
+
+    def spread(self):
+        """RMS distance (px) of the buffered centroids from their mean."""
+        n = self._count
+        if n < 2:
+            return 0.0
+        variance = (n * (self._sum_xx + self._sum_yy) - self._sum_x * self._sum_x - self._sum_y * self._sum_y) / (n * n)
+        return math.sqrt(max(0.0, variance))
+
+
+class ProtocolStateMachine:
+    """The six-phase adherence protocol as a pure step function over DetectionRecords.
+
+    step() updates the counters and phase, and leaves what happened in status / alert / warning /
+    issues codes for the caller to log or draw. It does no I/O and no drawing, so sessions can be
+    stepped in bulk from replays, caches and the multi-camera server alike.
+    """
+    __slots__ = ('phase', 'result_status', 'frame_count', 'elapsed', 'face_loss_seconds', 'phase_4_seconds',
+                 'final_confirm_seconds', 'pill_history', 'motion_tolerance', 'step_phase', 'status',
+                 'alert', 'warning', 'issues')
+
+    def __init__(self, motion_tolerance=None):
+        self.pill_history = CentroidWindow(PILL_STATIONARY_SECONDS)
+        self.motion_tolerance = motion_tolerance  # None follows STABILITY_THRESHOLD
+        self.reset()
+        self.result_status = "INITIALIZING"
+
+    def reset(self):
+        self.phase = 1
+        self.result_status = "RUNNING"
+        self.frame_count = 0
+        self.elapsed = 0.0  # Seconds of frame time stepped this session
+        self.face_loss_seconds = 0.0
+        self.phase_4_seconds = 0.0
+        self.final_confirm_seconds = 0.0
+        self.pill_history.clear()
+        self.step_phase = 1
+        self.status = STATUS_AWAITING
+        self.alert = ALERT_NONE
+        self.warning = WARNING_NONE
+        self.issues = 0
+
+    def _advance(self):
+        self.status = STATUS_ADVANCED
+        self.phase += 1
+        return TRANSITION_ADVANCE
+
+    def step(self, record):
+        """Consumes one frame's DetectionRecord. Returns TRANSITION_NONE, _ADVANCE or _FINISH.
+
+        The hold timers add up record.dt, so they measure elapsed time rather than frames.
+        Frames whose boxes were carried forward by the tracker (record.tracked) still advance the
+        hold timers, since they represent real elapsed time, but a phase only completes (or fails
+        on a detection) on a frame where YOLO actually ran.
+        """
+        phase = self.step_phase = self.phase
+        dt = record.dt
+        self.frame_count += 1
+        self.elapsed += dt
+        self.status = STATUS_AWAITING
+        self.alert = ALERT_NONE
+        self.warning = WARNING_NONE
+        self.issues = 0
+        confirmed = not record.tracked
+
+        if self.elapsed > STABILIZATION_SECONDS + TIMER_TOLERANCE_SECONDS:
+            if not record.face_found:
+                self.face_loss_seconds += dt
+                if self.face_loss_seconds >= FACE_LOSS_SECONDS - TIMER_TOLERANCE_SECONDS:
+                    self.result_status = "FATAL FAILURE (MOUTH COVERED)"
+                    return TRANSITION_FINISH
+            else:
+                self.face_loss_seconds = 0.0
+
+        if phase == 1:
+            if record.pill_conf >= CPill_P1_MIN:
+                if confirmed:
+                    return self._advance()
+            else:
+                self.alert = ALERT_PILL_NOT_DETECTED
+
+        elif phase == 2:
+            if record.tongue_conf >= CTONGUE_MIN and record.jaw_distance > MOUTH_OPEN_THRESHOLD:
+                if confirmed:
+                    return self._advance()
+            else:
+                self.alert = ALERT_OPEN_WIDER
+
+        elif phase == 3:
+            if record.pill_on_tongue_conf >= CPill_P3_MIN:
+                if record.has_pill_on_tongue_box:
+                    self.pill_history.append(record.pill_on_tongue_cx, record.pill_on_tongue_cy, dt)
+                else:
+                    self.pill_history.clear()
+
+                # The window slides, so a pill that settles after moving passes once it has been
+                # still for a full window
+                window_full = self.pill_history.full
+                tolerance = self.motion_tolerance if self.motion_tolerance is not None else STABILITY_THRESHOLD
+                still = window_full and self.pill_history.spread() <= tolerance
+                if still and confirmed:
+                    self.pill_history.clear()
+                    return self._advance()
+                self.status = STATUS_PILL_MOVING if window_full and not still else STATUS_HOLD_PILL
+            else:
+                self.pill_history.clear()
+                self.alert = ALERT_PLACE_PILL
+
+        elif phase == 4:
+            tongue_absent = record.tongue_conf < CTongue_P4_MAX
+            jaw_closed = record.jaw_distance < MOUTH_CLOSURE_THRESHOLD
+
+            if self.phase_4_seconds > 0 and record.jaw_distance > MOUTH_OPEN_THRESHOLD and record.pill_on_tongue_conf < CPill_P3_MIN:
+                self.phase_4_seconds = 0.0
+                self.warning = WARNING_MEDICATION_MISSING
+
+            if tongue_absent and jaw_closed:
+                if self.phase_4_seconds < CONCEALMENT_SECONDS - TIMER_TOLERANCE_SECONDS or not confirmed:
+                    self.phase_4_seconds = min(self.phase_4_seconds + dt, CONCEALMENT_SECONDS)
+                    self.status = STATUS_HOLD_CLOSE
+                else:
+                    self.phase_4_seconds = 0.0
+                    return self._advance()
+            else:
+                if self.phase_4_seconds > 0 and not self.warning:
+                    self.phase_4_seconds = 0.0
+                    self.warning = WARNING_OPENED_EARLY
+                if not tongue_absent: self.issues |= ISSUE_TONGUE_VISIBLE
+                if not jaw_closed: self.issues |= ISSUE_JAW_OPEN
+                if not self.warning:
+                    self.alert = ALERT_CLOSE_MOUTH
+
+        elif phase == 5:
+            if record.pill_on_tongue_conf >= CPill_P3_MIN and confirmed:
+                self.result_status = "FATAL FAILURE (PILL REAPPEARED)"
+                return TRANSITION_FINISH
+
+            if record.tongue_conf >= CTONGUE_MIN:
+                if confirmed:
+                    return self._advance()
+            else:
+                self.alert = ALERT_REOPEN_MOUTH
+
+        elif phase == 6:
+            tongue_no_pill_confirmed = record.tongue_conf >= CTONGUE_MIN
+            pill_gone = record.pill_conf < CPill_P6_MAX
+
+            if tongue_no_pill_confirmed and pill_gone:
+                self.final_confirm_seconds += dt
+                if self.final_confirm_seconds >= FINAL_CONFIRMATION_SECONDS - TIMER_TOLERANCE_SECONDS and confirmed:
+                    self.status = STATUS_PASS
+                    self.result_status = VERIFIED_PASS
+                    return TRANSITION_FINISH
+                self.status = STATUS_FINAL_CHECK
+            else:
+                self.final_confirm_seconds = 0.0
+                self.status = STATUS_SWALLOW_FAIL
+                self.alert = ALERT_SWALLOW
+                if not tongue_no_pill_confirmed: self.issues |= ISSUE_MOUTH_CLOSED
+                if not pill_gone: self.issues |= ISSUE_PILL_VISIBLE
+
+        return TRANSITION_NONE
+
+    def status_text(self):
+        """The bottom-line status the overlay shows for the last step."""
+        if self.status == STATUS_ADVANCED:
+            return ADVANCE_TEXTS[self.step_phase]
+        if self.status == STATUS_HOLD_PILL:
+            return f"HOLD: {self.pill_history.duration:.1f}/{PILL_STATIONARY_SECONDS:g}s steady"
+        if self.status == STATUS_PILL_MOVING:
+            return f"HOLD STILL: pill moving ({self.pill_history.spread():.1f}px > {self.motion_tolerance if self.motion_tolerance is not None else STABILITY_THRESHOLD}px)"
+        if self.status == STATUS_HOLD_CLOSE:
+            return f"HOLD CLOSE: {self.phase_4_seconds:.1f}/{CONCEALMENT_SECONDS:.1f}s"
+        if self.status == STATUS_FINAL_CHECK:
+            return f"FINAL CHECK: Hold for {max(0.0, FINAL_CONFIRMATION_SECONDS - self.final_confirm_seconds):.1f} more seconds."
+        if self.status == STATUS_SWALLOW_FAIL:
+            return "FAILURE: Pill still visible! SWALLOW NOW!"
+        if self.status == STATUS_PASS:
+            return VERIFIED_PASS
+        return f"Phase {self.step_phase} (Awaiting Action)"
+
+
 class YOLOv11MedicationMonitor:
-    def __init__(self, obj_weights_path, video_source=0, max_frames=200):
+    def __init__(self, obj_weights_path, video_source=0, max_frames=200, session_id=DEFAULT_SESSION_ID, pipelined=PIPELINED_MODE,
+                 concurrent_detection=CONCURRENT_DETECTION, roi_mode=ROI_MODE,
+                 detect_every_n_frames=DETECT_EVERY_N_FRAMES, batched_inference=BATCHED_INFERENCE,
+                 headless=HEADLESS_MODE, record_evidence=EVIDENCE_RECORDING, target_fps=PACING_TARGET_FPS):
         self.obj_weights_path = obj_weights_path
         self.video_source = video_source
         self.max_frames = max_frames
-        self.current_phase = 1
-        self.pill_history = collections.deque(maxlen=PILL_STATIONARY_FRAMES)
-        self.final_confirm_counter = 0
-        self.current_frame = None
-        self.result_status = "INITIALIZING"
-        self.frame_count = 0
+        self.session_id = session_id
+        self.window_name = WINDOW_TITLE if session_id == DEFAULT_SESSION_ID else f"{WINDOW_TITLE} [{session_id}]"
+        self.pipelined = pipelined
+        self.roi_mode = roi_mode
+        self.mouth_roi = None  # (x1, y1, x2, y2) crop around the mouth, None = full-frame search
+        self.detect_every_n_frames = max(1, detect_every_n_frames)
+        self._last_object_boxes = None
+        self._prev_object_boxes = None
+        self._frames_since_detection = 0
+        self.protocol = ProtocolStateMachine()
+        self._record = DetectionRecord()
+        self.last_capture_time = None
+        self.session_started_at = None  # Wall-clock datetime the current session started
+        self._session_start_time = None  # time.monotonic() at session start, for durations
+        self._last_frame_time = None
+        self.phase_durations = collections.defaultdict(float)
+        self.detection_log = None  # List to append each frame's detections to, for save_detection_cache
+        self.record_evidence = record_evidence
+        self.target_fps = target_fps
+        self.evidence = None  # EvidenceRecorder for the current session when record_evidence is on
+        self.last_transition = TRANSITION_NONE
+        self._replaying = False  # Set by replay(), so the MOCK detector reports a face
+        self._frame_ring = None  # FrameRing of the current run
         self.should_reset = False
         self.running = True
-        self.camera_opened_once = False  # Track first camera window open
+        self.camera_opened_once = False  # Track first captured camera frame
         self.window_created = False  # Track cv2 window creation
+        self.headless = headless
+        self.metrics = StageMetrics()
+        self.broadcaster = FrameBroadcaster(self.metrics)
+        self.status = StatusPublisher()
+
+        # Models are loaded by load_models(), off the constructor, so the server can answer at once
+        self.batched_inference = batched_inference
+        self.obj_model = self.obj_model_lock = None
+        self._target_class_ids = None  # Model class id per TARGET_CLASSES entry, for select_class_boxes
+        self.inference_server = None
+        self.face_mesh_detector = None
+        # not_loaded -> loading -> warming_up -> ready; "mock" for weights "MOCK", "failed" when loading
+        # raised, "degraded" when the camera would not open. Only ready and an explicit MOCK count on /ready.
+        self.model_state = "not_loaded"
+        self.startup_timings = {}  # Step -> milliseconds, reported on /ready and /metrics
+        self.models_ready = threading.Event()  # Set once load_models() has finished, whatever the outcome
+        self._load_lock = threading.Lock()
+        # FaceMesh is not thread-safe, so a single persistent worker owns it in concurrent mode
+        self.face_mesh_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='facemesh') if concurrent_detection else None
+        self.cap = None
+        self._publish_status()
+
+    # Protocol state lives in self.protocol; these keep the monitor's long-standing attributes
+    @property
+    def current_phase(self):
+        return self.protocol.phase
+
+    @current_phase.setter
+    def current_phase(self, phase):
+        self.protocol.phase = phase
+
+    @property
+    def result_status(self):
+        return self.protocol.result_status
+
+    @result_status.setter
+    def result_status(self, status):
+        self.protocol.result_status = status
 
-        self.obj_model = self._load_yolo_model(self.obj_weights_path, name='Object')
+    @property
+    def frame_count(self):
+        return self.protocol.frame_count
 
-        self.face_mesh_detector = mp.solutions.face_mesh.FaceMesh(
+    def _load_yolo_model(self, weights_path, name):
+        """Returns (model, lock) for weights_path, loading it only the first time any session asks.
+
+        Every session shares the same model; the lock serializes forward passes through it.
+        The backend comes from load_detector (DETECTOR_BACKEND, "auto" by file type).
+        weights_path="MOCK" skips loading and uses _get_mock_detections (replay / CI).
+        A failed load raises here and in every session waiting on it, and is dropped from the cache
+        so the next session tries again.
+        """
+        with _yolo_models_lock:
+            loaded = _yolo_models.get(weights_path)
+            if loaded is None:
+                loaded = _yolo_models[weights_path] = Future()
+                loading = True
+            else:
+                loading = False
+        if not loading:
+            return loaded.result()  # Another session is loading (or has loaded) these weights
+
+        if weights_path == "MOCK":
+            model = "MOCK"
+        else:
+            try:
+                print(f"Loading {name} Model from: {weights_path}...")
+                model = load_detector(weights_path)
+                print(f"✅ {name} Model loaded successfully ({model.backend} backend).")
+            except Exception as e:
+                with _yolo_models_lock:
+                    if _yolo_models.get(weights_path) is loaded:
+                        del _yolo_models[weights_path]
+                loaded.set_exception(e)
+                raise
+        loaded.set_result((model, threading.Lock()))
+        return loaded.result()
+
+    def load_models(self):
+        """Loads YOLO and FaceMesh and warms both up on blank frames. Safe to call more than once.
+
+        run_protocol calls this on a background thread while the camera opens; replay() calls it
+        inline. Per-step timings go to startup_timings and the log to track cold starts.
+        """
+        with self._load_lock:
+            if self.models_ready.is_set():
+                return
+            try:
+                self.model_state = "loading"
+                (self.obj_model, self.obj_model_lock), self.startup_timings['yolo_load_ms'] = \
+                    self._timed_ms(self._load_yolo_model, self.obj_weights_path, 'Object')
+                if self.obj_model == "MOCK":
+                    self.model_state = "mock"  # The mock path never runs FaceMesh either
+                else:
+                    self.inference_server = self._get_inference_server() if self.batched_inference else None
+                    self.face_mesh_detector, self.startup_timings['face_mesh_load_ms'] = self._timed_ms(self._load_face_mesh)
+
+                    self.model_state = "warming_up"
+                    _, self.startup_timings['yolo_warmup_ms'] = self._timed_ms(self._warm_up_yolo)
+                    _, self.startup_timings['face_mesh_warmup_ms'] = self._timed_ms(self._warm_up_face_mesh)
+                    self.model_state = "ready"
+            except Exception as e:
+                print(f"❌ ERROR: Could not load models for session {self.session_id}. Using MOCK fallback. Error: {e}")
+                self.obj_model = "MOCK"
+                self.model_state = "failed"
+            finally:
+                self.startup_timings['ready_since_process_start_ms'] = (time.monotonic() - _process_started) * 1000
+                self.models_ready.set()
+            timings = ', '.join(f"{step} {ms:.0f}" for step, ms in self.startup_timings.items())
+            print(f"🔥 Session '{self.session_id}' models {self.model_state} ({timings})")
+
+    def _timed_ms(self, fn, *args):
+        result, seconds = self._timed(fn, *args)
+        return result, seconds * 1000
+
+    def _load_face_mesh(self):
+        import mediapipe as mp  # Imported here so importing proto stays cheap (replay / sweep)
+        return mp.solutions.face_mesh.FaceMesh(
             max_num_faces=1,
             refine_landmarks=True,
             min_detection_confidence=0.5
         )
-        self.cap = None
 
-    def _load_yolo_model(self, weights_path, name):
-        try:
-            print(f"Loading {name} Model from: {weights_path}...")
-            model = YOLO(weights_path)
-            print(f"✅ {name} Model loaded successfully.")
-            return model
-        except Exception as e:
-            print(f"⚠️ Error loading {name} model from {weights_path}. Using MOCK fallback. Error: {e}")
-            return "MOCK"
+    def _warm_up_yolo(self):
+        """Runs the full-frame and mouth-ROI input sizes once each so their graphs are built."""
+        frame = np.zeros((*WARMUP_FRAME_SIZE, 3), dtype=np.uint8)
+        inputs = [(frame, None)]
+        if self.roi_mode:
+            inputs.append((frame[:ROI_MIN_SIZE, :ROI_MIN_SIZE], ROI_IMGSZ))
+        with self.obj_model_lock:
+            for image, imgsz in inputs:
+                for _ in range(WARMUP_PASSES):
+                    self.obj_model([image], imgsz)
+
+    def _warm_up_face_mesh(self):
+        """Runs FaceMesh once, on its worker thread when there is one."""
+        frame = np.zeros((*WARMUP_FRAME_SIZE, 3), dtype=np.uint8)
+        if self.face_mesh_executor is not None:
+            self.face_mesh_executor.submit(self._detect_face, frame).result()
+        else:
+            self._detect_face(frame)
+
+    def readiness(self):
+        """Load / warm-up state for /ready."""
+        return {
+            "ready": self.model_state == "ready" or (self.model_state == "mock" and self.obj_weights_path == "MOCK"),
+            "state": self.model_state,
+            "timings_ms": {step: round(ms, 1) for step, ms in self.startup_timings.items()},
+        }
+
+    def _get_inference_server(self):
+        """Returns the BatchedInferenceServer shared by every session using these weights."""
+        if self.obj_model == "MOCK":
+            return None
+        with _yolo_models_lock:
+            if self.obj_weights_path not in _inference_servers:
+                _inference_servers[self.obj_weights_path] = BatchedInferenceServer(self.obj_model, self.obj_model_lock)
+            return _inference_servers[self.obj_weights_path]
 
     def _get_mock_detections(self):
         mock_detections = {cls: (0.0, None) for cls in TARGET_CLASSES}
+        # Only replays get a face: a live MOCK fallback has nobody in front of a real model
+        mock_detections['lip_landmarks'] = MOCK_LIP_LANDMARKS if self._replaying else None
 
         if self.current_phase == 2:
             mock_detections['jaw_distance'] = 30
         elif self.current_phase == 4:
-            mock_detections['jaw_distance'] = 5
+            mock_detections['jaw_distance'] = MOUTH_CLOSURE_THRESHOLD - 3
 
         if self.current_phase == 1:
             mock_detections['pill'] = (0.95, (100, 100, 20, 20))
@@ -127,430 +1939,1016 @@ class YOLOv11MedicationMonitor:
         vertical_distance = abs(LL_Y - UL_Y)
         return vertical_distance, True
 
+    def _detect_objects(self, frame, detections, roi=None):
+        """Runs the YOLO object model and keeps the best box per target class in detections,
+        plus the DETECTION_TOP_K best per class under detections['top_k'].
+
+        With an roi (x1, y1, x2, y2) only that crop is searched, at ROI_IMGSZ, and the boxes are
+        mapped back to full-frame coordinates.
+        """
+        if roi is None:
+            image, imgsz, ox, oy = frame, None, 0, 0
+        else:
+            ox, oy, rx2, ry2 = roi
+            image, imgsz = frame[oy:ry2, ox:rx2], ROI_IMGSZ
+
+        if self.inference_server is not None:
+            obj_results = self.inference_server.infer(image, imgsz)
+        else:
+            with self.obj_model_lock:
+                obj_results = self.obj_model([image], imgsz)[0]
+        if self._target_class_ids is None:
+            self._target_class_ids = target_class_ids(self.obj_model.names)
+
+        top_k = select_class_boxes(obj_results, self._target_class_ids, (ox, oy))
+        for label, boxes in top_k.items():
+            if boxes[0][0] > detections[label][0]: detections[label] = boxes[0]
+        detections['top_k'] = top_k
+
+    def _track_objects(self, frame, detections, roi=None):
+        """Fills detections from the last two YOLO results instead of running the model.
+
+        Each box is moved along its per-frame velocity between those two results; confidences
+        are carried forward unchanged. Frames filled this way are flagged as 'tracked' and never
+        complete a phase on their own (see _advance_protocol).
+        """
+        last, prev = self._last_object_boxes, self._prev_object_boxes
+        steps = self._frames_since_detection + 1
+        for cls in TARGET_CLASSES:
+            conf, bbox = last[cls]
+            prev_bbox = prev[cls][1] if prev else None
+            if bbox is not None and prev_bbox is not None:
+                vx = (bbox[0] - prev_bbox[0]) / self.detect_every_n_frames
+                vy = (bbox[1] - prev_bbox[1]) / self.detect_every_n_frames
+                bbox = (int(bbox[0] + vx * steps), int(bbox[1] + vy * steps), bbox[2], bbox[3])
+            detections[cls] = (conf, bbox)
+        detections['tracked'] = True
+
+    def _should_track(self):
+        return (self.detect_every_n_frames > 1 and self._last_object_boxes is not None
+                and self._frames_since_detection + 1 < self.detect_every_n_frames)
+
+    def _record_object_boxes(self, detections, tracked):
+        if tracked:
+            self._frames_since_detection += 1
+        else:
+            self._prev_object_boxes = self._last_object_boxes
+            self._last_object_boxes = {cls: detections[cls] for cls in TARGET_CLASSES}
+            self._frames_since_detection = 0
+
+    def _detect_face(self, frame):
+        """Runs MediaPipe FaceMesh on frame and returns its raw results."""
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        return self.face_mesh_detector.process(rgb_frame)
+
+    def _inference_roi(self):
+        """Returns the mouth crop to search this frame, or None for a full-frame search."""
+        if not self.roi_mode or self.current_phase not in ROI_PHASES:
+            return None  # Phase 1 looks for the pill held up, phase 6 for it anywhere in the frame
+        return self.mouth_roi
+
+    def _update_mouth_roi(self, landmarks, w, h):
+        """Re-centres the mouth crop on the current lip landmarks, clipped to the frame."""
+        xs = [landmarks[i].x * w for i in MOUTH_ROI_LANDMARK_IDS]
+        ys = [landmarks[i].y * h for i in MOUTH_ROI_LANDMARK_IDS]
+        cx, cy = (min(xs) + max(xs)) / 2, (min(ys) + max(ys)) / 2
+        half = max(ROI_MIN_SIZE, ROI_SCALE * max(max(xs) - min(xs), max(ys) - min(ys))) / 2
+        x1 = max(0, int(cx - half)); y1 = max(0, int(cy - half))
+        x2 = min(w, int(cx + half)); y2 = min(h, int(cy + half))
+        self.mouth_roi = (x1, y1, x2, y2) if x2 > x1 and y2 > y1 else None
+
+    def _timed(self, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        return result, time.perf_counter() - start
+
     def _yolo_detect(self, frame):
+        """Runs the object model and FaceMesh on frame and returns the per-frame detections dict.
+
+        In concurrent mode FaceMesh runs on the persistent face_mesh_executor while YOLO runs on
+        the calling thread; both release the GIL, so the frame costs roughly the slower of the two.
+        Per-model seconds are reported under detections['model_timings'].
+
+        In ROI mode YOLO only searches a padded crop around the mouth found by the previous
+        frame's lip landmarks in ROI_PHASES; as soon as FaceMesh loses the face it goes back to
+        the full frame.
+
+        With detect_every_n_frames > 1 YOLO is replaced by _track_objects on the frames in
+        between; FaceMesh still runs on every frame, so jaw distance and face loss stay real.
+        """
         if self.obj_model == "MOCK": return self._get_mock_detections()
 
         detections = {cls: (0.0, None) for cls in TARGET_CLASSES}
         detections['jaw_distance'] = 0.0
         detections['lip_landmarks'] = None
+        detections['roi'] = roi = self._inference_roi()
+        tracked = self._should_track()
+        detect_objects = self._track_objects if tracked else self._detect_objects
 
         try:
-            obj_results = self.obj_model(frame, verbose=False, conf=0.1)[0]
-            class_names = self.obj_model.names
+            if self.face_mesh_executor is not None:
+                face_future = self.face_mesh_executor.submit(self._timed, self._detect_face, frame)
+                try:
+                    _, yolo_seconds = self._timed(detect_objects, frame, detections, roi)
+                finally:
+                    mp_results, face_mesh_seconds = face_future.result()
+            else:
+                _, yolo_seconds = self._timed(detect_objects, frame, detections, roi)
+                mp_results, face_mesh_seconds = self._timed(self._detect_face, frame)
+            self._record_object_boxes(detections, tracked)
 
-            for box in obj_results.boxes:
-                conf = box.conf.item(); cls = int(box.cls.item())
-                label = class_names[cls] if cls < len(class_names) else None
-                if label in TARGET_CLASSES:
-                    x1, y1, x2, y2 = map(int, box.xyxy[0].tolist()); w, h = x2 - x1, y2 - y1; cx, cy = x1 + w // 2, y1 + h // 2
-                    if conf > detections[label][0]: detections[label] = (conf, (cx, cy, w, h))
+            detections['model_timings'] = {'yolo': yolo_seconds, 'face_mesh': face_mesh_seconds}
+            if not tracked:
+                self.metrics.observe('yolo', yolo_seconds)
+            self.metrics.observe('face_mesh', face_mesh_seconds)
 
             h, w, _ = frame.shape
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            mp_results = self.face_mesh_detector.process(rgb_frame)
-
             if mp_results.multi_face_landmarks:
                 jaw_drop, _ = self._calculate_jaw_drop(mp_results.multi_face_landmarks, h)
                 detections['jaw_distance'] = jaw_drop
                 detections['lip_landmarks'] = mp_results.multi_face_landmarks[0].landmark
+                self._update_mouth_roi(detections['lip_landmarks'], w, h)
+            else:
+                self.mouth_roi = None
 
         except Exception:
             return self._get_mock_detections()
 
         return detections
 
-    def _check_detection(self, detections, object_name, min_conf):
-        conf, _ = detections.get(object_name, (0.0, None))
-        return conf >= min_conf
-
-    def _check_absence(self, detections, object_name, max_conf):
-        conf, _ = detections.get(object_name, (0.0, None))
-        return conf < max_conf
-
-    def _calculate_centroid(self, bbox_info):
-        if bbox_info is None: return None
-        cx, cy, _, _ = bbox_info
-        return (cx, cy)
-
     def save_result_to_json(self):
-        """Saves the final protocol status and timestamp to a JSON file in the 'patient_report' directory."""
-        REPORT_DIR = "patient_report"
-
-        if not os.path.exists(REPORT_DIR):
-            try:
-                os.makedirs(REPORT_DIR)
-                print(f"✅ Created directory: {REPORT_DIR}")
-            except OSError as e:
-                print(f"❌ ERROR: Failed to create directory {REPORT_DIR}. Reason: {e}")
-                return
-
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"adherence_log_{timestamp}.json"
-        full_path = os.path.join(REPORT_DIR, filename)
+        """Queues the final protocol status and timing for the background report writer."""
+        ended_at = datetime.now()
+        duration_seconds = time.monotonic() - self._session_start_time if self._session_start_time else 0.0
 
         data = {
-            "timestamp": timestamp,
+            "timestamp": ended_at.strftime("%Y%m%d_%H%M%S"),
+            "ended_at": ended_at.isoformat(timespec='milliseconds'),
+            "session_id": self.session_id,
             "final_status": self.result_status,
             "current_phase_at_end": self.current_phase,
-            "protocol_duration_approx_seconds": self.frame_count * 0.03,
+            # Kept for older readers; now measured rather than estimated from frame_count
+            "protocol_duration_approx_seconds": duration_seconds,
+            "protocol_duration_seconds": duration_seconds,
+            "session_started_at": self.session_started_at.isoformat() if self.session_started_at else None,
+            "frames_processed": self.frame_count,
+            "mean_fps": self.frame_count / duration_seconds if duration_seconds > 0 else 0.0,
+            "phase_durations_seconds": {str(phase): round(seconds, 3) for phase, seconds in sorted(self.phase_durations.items())},
             "yolo_model_path": self.obj_weights_path,
+            "evidence_dir": self._finish_evidence(),
         }
+        report_writer.submit(data)
 
+    def _open_camera(self):
+        """Opens (or reopens) the capture device for a new session. Returns True if it opened."""
+        if self.cap is not None:
+            self.cap.release()
+            print("📷 Releasing previous camera instance")
+            time.sleep(0.5)
+
+        print("📷 Opening camera...")
+        self.cap = cv2.VideoCapture(self.video_source)
+        is_camera_open = self.cap.isOpened()
+
+        if not is_camera_open:
+            print(f"❌ Error: Could not open video source {self.video_source}. Running in MOCK mode only.")
+            self.models_ready.wait()  # So the background loader cannot put the real model back
+            self.obj_model = "MOCK"
+            if self.model_state != "failed":
+                self.model_state = "mock" if self.obj_weights_path == "MOCK" else "degraded"
+            self.inference_server = None  # No frames will come from this session
+        else:
+            print("✅ Camera opened successfully")
+            if not self.window_created and not self.headless:
+                try:
+                    cv2.namedWindow(self.window_name, cv2.WINDOW_NORMAL)
+                except Exception:
+                    pass
+                init_frame = np.zeros((480, 640, 3), dtype=np.uint8)
+                cv2.putText(init_frame, "Camera ready. Initializing...", (20, 40), FONT, 0.7, (255, 255, 255), 2, cv2.LINE_AA)
+                cv2.imshow(self.window_name, init_frame)
+                cv2.waitKey(1)
+                self.window_created = True
+        return is_camera_open
+
+    def _reset_session_state(self):
+        self.protocol.reset()
+        self.last_capture_time = None
+        self.session_started_at = datetime.now()
+        self._session_start_time = self._last_frame_time = time.monotonic()
+        self.phase_durations.clear()
+        self.mouth_roi = None
+        self._last_object_boxes = None
+        self._prev_object_boxes = None
+        self._frames_since_detection = 0
+        self.should_reset = False
+        self.last_transition = TRANSITION_NONE
+        self._finish_evidence()
+        if self.record_evidence:
+            try:
+                self.evidence = EvidenceRecorder(self.session_id, self.session_started_at)
+            except OSError as e:
+                print(f"❌ ERROR: Could not create evidence directory for session {self.session_id}. Reason: {e}")
+        self._publish_status()
+
+    def _finish_evidence(self):
+        """Hands the current session's evidence to its encoder to finalize. Returns its dir or None."""
+        if self.evidence is None:
+            return None
+        evidence, self.evidence = self.evidence, None
+        return evidence.finish(self.result_status)
+
+    def status_snapshot(self):
+        """The fields pushed on /status_stream: the /status_update pair plus the hold counters."""
+        return {
+            "result_status": self.result_status,
+            "current_phase": self.current_phase,
+            "progress": {
+                "pill_steady_seconds": round(self.protocol.pill_history.duration, 2),
+                "pill_steady_target_seconds": PILL_STATIONARY_SECONDS,
+                "mouth_closed_seconds": round(self.protocol.phase_4_seconds, 2),
+                "mouth_closed_target_seconds": round(CONCEALMENT_SECONDS, 2),
+                "final_confirm_seconds": round(self.protocol.final_confirm_seconds, 2),
+                "final_confirm_target_seconds": FINAL_CONFIRMATION_SECONDS,
+            },
+        }
+
+    def _record_frame_done(self, phase):
+        """Charges the wall-clock time since the previous frame to the phase this frame was in."""
+        now = time.monotonic()
+        frame_seconds = now - self._last_frame_time
+        self._last_frame_time = now
+        self.phase_durations[phase] += frame_seconds
+        self.metrics.frame_done(now, phase, frame_seconds)
+
+    def _publish_status(self):
+        self.status.update(self.status_snapshot())
+
+    def _read_frame(self, is_camera_open, ring, lease):
+        """Capture stage: returns the next camera frame (or a blank MOCK frame), None on read failure.
+
+        lease is a slot from ring.acquire() to read into; with None the frame gets a fresh array.
+        """
+        slot, buffer = lease if lease is not None else (None, None)
+        if not is_camera_open:
+            if buffer is None or buffer.shape != (480, 640, 3):
+                frame = np.zeros((480, 640, 3), dtype=np.uint8)
+            else:
+                frame = buffer
+                frame.fill(0)  # Clear the previous MOCK frame's overlays
+        else:
+            start = time.perf_counter()
+            ret, frame = self.cap.read(buffer)
+            self.metrics.observe('capture', time.perf_counter() - start)
+            if not ret:
+                print("❌ Failed to read frame from camera")
+                frame = None
+        return ring.fill(slot, frame) if lease is not None else frame
+
+    def _sequential_frames(self, is_camera_open):
+        """Yields (frame_index, captured_at, frame, detections) with capture and inference on this thread."""
+        ring = self._frame_ring = FrameRing()
+        frame_index = 0
+        pacer = FramePacer(self.target_fps)
+        while True:
+            # Only this thread reads, so a held slot just means streams are slow: use a fresh array
+            frame = self._read_frame(is_camera_open, ring, ring.acquire())
+            if frame is None:
+                return
+            frame_index += 1
+            captured_at = time.monotonic()
+            try:
+                yield frame_index, captured_at, frame, self._yolo_detect(frame)
+            finally:
+                ring.release(frame)
+            pacer.wait()
+
+    def _grab_frames(self, is_camera_open, ring, out_queue, stop_event):
+        """Pipeline capture stage: keeps only the newest camera frame in out_queue.
+
+        A camera frame arriving while every ring slot is still held downstream is dropped, not
+        read over a frame in use; the gap in frame_index counts it as dropped.
+        """
+        frame_index = 0
+        pacer = FramePacer(self.target_fps) if not is_camera_open else None  # The camera paces itself
+        while not stop_event.is_set():
+            lease = ring.acquire()
+            frame_index += 1
+            if lease is None:
+                if is_camera_open and not self.cap.grab():
+                    break
+            else:
+                frame = self._read_frame(is_camera_open, ring, lease)
+                if frame is None:
+                    break
+                out_queue.put((frame_index, time.monotonic(), frame))
+            if pacer is not None:
+                pacer.wait()
+        out_queue.close()
+
+    def _infer_frames(self, in_queue, out_queue, stop_event):
+        """Pipeline inference stage: runs detection on the newest grabbed frame."""
+        while not stop_event.is_set():
+            packet = in_queue.get(timeout=0.1)
+            if packet is None:
+                if in_queue.closed:
+                    break
+                continue
+            frame_index, captured_at, frame = packet
+            out_queue.put((frame_index, captured_at, frame, self._yolo_detect(frame)))
+        out_queue.close()
+
+    def _pipelined_frames(self, is_camera_open):
+        """Yields (frame_index, captured_at, frame, detections) from the capture and inference threads.
+
+        Both hand-offs are latest-wins, so a slow stage drops intermediate frames rather than
+        building latency. The packets that do arrive are always in capture order. Every packet
+        holds its frame's ring slot until it is dropped or this generator has moved past it.
+        """
+        ring = self._frame_ring = FrameRing()
+        release = lambda packet: ring.release(packet[2])
+        grabbed = LatestQueue(PIPELINE_QUEUE_SIZE, on_drop=release)
+        inferred = LatestQueue(PIPELINE_QUEUE_SIZE, on_drop=release)
+        stop_event = threading.Event()
+        stages = [
+            threading.Thread(target=self._grab_frames, args=(is_camera_open, ring, grabbed, stop_event), daemon=True),
+            threading.Thread(target=self._infer_frames, args=(grabbed, inferred, stop_event), daemon=True),
+        ]
+        for stage in stages:
+            stage.start()
+
+        try:
+            last_index = 0
+            while True:
+                packet = inferred.get(timeout=0.1)
+                if packet is None:
+                    if inferred.closed:
+                        return
+                    continue
+                if packet[0] <= last_index:
+                    release(packet)
+                    continue
+                if packet[0] > last_index + 1:
+                    self.metrics.add_dropped(packet[0] - last_index - 1)
+                last_index = packet[0]
+                try:
+                    yield packet
+                finally:
+                    release(packet)
+        finally:
+            stop_event.set()
+            for stage in stages:
+                stage.join(timeout=2.0)
+
+    def _advance_protocol(self, frame, detections, dt):
+        """Steps the protocol state machine on this frame's detections and draws its prompts.
+
+        dt is the frame time credited to the hold timers. Returns False when the session has
+        reached a final verdict. frame may be None to skip drawing (headless with no viewers).
+        """
+        record = self._record.load(detections, dt)
+        transition = self.last_transition = self.protocol.step(record)
+
+        if self.protocol.warning == WARNING_MEDICATION_MISSING:
+            print(f"--- ⚠️ PHASE 4 RESET: Mouth opened wide ({record.jaw_distance:.1f}) but no pill on tongue detected ({record.pill_on_tongue_conf:.2f}). ---")
+        if transition == TRANSITION_FINISH:
+            if self.result_status == VERIFIED_PASS:
+                print(f"\n--- 🎉 PROTOCOL COMPLETE! {VERIFIED_PASS} ---")
+            elif self.result_status == "FATAL FAILURE (MOUTH COVERED)":
+                print(f"\n--- ❌ FATAL FAILURE: MOUTH AREA COVERED OR LOST FOR 2 SECONDS ---")
+            else:
+                print(f"\n--- ❌ FATAL FAILURE: PILL DETECTED ON TONGUE AFTER CONCEALMENT ---")
+
+        if frame is not None:
+            self._draw_protocol(frame, record)
+        return transition != TRANSITION_FINISH
+
+    def _draw_protocol(self, frame, record):
+        """Draws the phase prompt, the alert / warning lines and the status line for the last step."""
+        protocol = self.protocol
+        jaw_distance = record.jaw_distance
+        cv2.putText(frame, PHASE_PROMPTS.get(protocol.step_phase, "Protocol Starting..."), (10, 50), FONT, FONT_SCALE, COLOR_PROMPT, LINE_THICKNESS, cv2.LINE_AA)
+
+        if protocol.alert == ALERT_PILL_NOT_DETECTED:
+            cv2.putText(frame, "Pill NOT Detected!", (10, 90), FONT, FONT_SCALE, COLOR_FAIL, LINE_THICKNESS, cv2.LINE_AA)
+        elif protocol.alert == ALERT_OPEN_WIDER:
+            cv2.putText(frame, f"Open mouth WIDER! (Drop: {jaw_distance:.1f}px)", (10, 90), FONT, FONT_SCALE, COLOR_FAIL, LINE_THICKNESS, cv2.LINE_AA)
+        elif protocol.alert == ALERT_PLACE_PILL:
+            cv2.putText(frame, "Place pill on tongue and hold!", (10, 90), FONT, FONT_SCALE, COLOR_FAIL, LINE_THICKNESS, cv2.LINE_AA)
+        elif protocol.alert == ALERT_CLOSE_MOUTH:
+            feedback = []
+            if protocol.issues & ISSUE_TONGUE_VISIBLE: feedback.append("Medication Missing!.")
+            if protocol.issues & ISSUE_JAW_OPEN: feedback.append(f"Jaws not fully closed (Drop: {jaw_distance:.1f}px).")
+            cv2.putText(frame, "Please close your mouth completely!", (10, 90), FONT, 0.7, COLOR_FAIL, LINE_THICKNESS, cv2.LINE_AA)
+            cv2.putText(frame, f"Failure: {', '.join(feedback)}", (10, 120), FONT, 0.6, COLOR_FAIL, 1, cv2.LINE_AA)
+        elif protocol.alert == ALERT_REOPEN_MOUTH:
+            cv2.putText(frame, "Open mouth wide again and show tongue!", (10, 90), FONT, 0.7, COLOR_FAIL, LINE_THICKNESS, cv2.LINE_AA)
+        elif protocol.alert == ALERT_SWALLOW:
+            feedback = []
+            if protocol.issues & ISSUE_MOUTH_CLOSED: feedback.append("Mouth must be open")
+            if protocol.issues & ISSUE_PILL_VISIBLE: feedback.append("Pill is still detected (SWALLOW!)")
+            cv2.putText(frame, protocol.status_text(), (10, 90), FONT, 0.7, COLOR_FAIL, LINE_THICKNESS, cv2.LINE_AA)
+            cv2.putText(frame, f"Issue: {', '.join(feedback)}", (10, 120), FONT, 0.6, COLOR_FAIL, 1, cv2.LINE_AA)
+
+        status_text = protocol.status_text()
+        color_final_status = COLOR_STATUS if status_text.startswith("SUCCESS") or status_text == VERIFIED_PASS else (255, 255, 255)
+        cv2.putText(frame, status_text, (10, frame.shape[0] - 10), FONT, 0.7, color_final_status, LINE_THICKNESS, cv2.LINE_AA)
+
+        if protocol.warning:
+            cv2.putText(frame, WARNING_TEXTS[protocol.warning], (10, 90), FONT, 0.7, COLOR_FAIL, LINE_THICKNESS, cv2.LINE_AA)
+
+    def _draw_detections(self, frame, detections):
+        """Render stage: draws lip landmarks and detection boxes on frame."""
+        h, w, _ = frame.shape
+
+        if detections.get('lip_landmarks'):
+            landmarks = detections['lip_landmarks']
+            UL_X = int(landmarks[UPPER_LIP_ID].x * w); UL_Y = int(landmarks[UPPER_LIP_ID].y * h)
+            LL_X = int(landmarks[LOWER_LIP_ID].x * w); LL_Y = int(landmarks[LOWER_LIP_ID].y * h)
+
+            cv2.circle(frame, (UL_X, UL_Y), 3, (0, 0, 255), -1)
+            cv2.circle(frame, (LL_X, LL_Y), 3, (0, 255, 0), -1)
+            cv2.line(frame, (UL_X, UL_Y), (LL_X, LL_Y), (255, 255, 0), 1)
+
+            vertical_jaw_drop = detections.get('jaw_distance', 0.0)
+            cv2.putText(frame, f"Drop: {vertical_jaw_drop:.1f} px (Target < {MOUTH_CLOSURE_THRESHOLD})", (10, h - 30), FONT, 0.5, (0, 255, 255), 1, cv2.LINE_AA)
+
+        roi = detections.get('roi')
+        if roi is not None:
+            cv2.rectangle(frame, (roi[0], roi[1]), (roi[2], roi[3]), (128, 128, 128), 1)
+
+        mouth_conf, mouth_bbox = detections.get('mouth', (0.0, None))
+        if mouth_conf >= 0.5:
+            xyxy = _convert_bbox_to_xyxy(mouth_bbox); color = (255, 100, 0)
+            cv2.rectangle(frame, (xyxy[0], xyxy[1]), (xyxy[2], xyxy[3]), color, 1)
+            text = f"Mouth: {mouth_conf:.2f}"
+            cv2.putText(frame, text, (xyxy[0], xyxy[3] + 15), FONT, 0.5, color, 1, cv2.LINE_AA)
+
+        pill_on_tongue_conf, pill_on_tongue_bbox = detections.get('pill-on-tongue', (0.0, None))
+        if pill_on_tongue_conf >= 0.1:
+            xyxy = _convert_bbox_to_xyxy(pill_on_tongue_bbox); color = (255, 0, 255)
+            cv2.rectangle(frame, (xyxy[0], xyxy[1]), (xyxy[2], xyxy[3]), color, LINE_THICKNESS)
+            text = f"P-on-T: {pill_on_tongue_conf:.2f}"
+            cv2.putText(frame, text, (xyxy[0], xyxy[1] - 5), FONT, 0.6, color, LINE_THICKNESS, cv2.LINE_AA)
+
+        pill_conf, pill_bbox = detections.get('pill', (0.0, None))
+        if pill_conf >= 0.7 and self.current_phase < 4:
+            xyxy = _convert_bbox_to_xyxy(pill_bbox); color = (0, 255, 255)
+            cv2.rectangle(frame, (xyxy[0], xyxy[1]), (xyxy[2], xyxy[3]), color, LINE_THICKNESS)
+            text = f"Pill: {pill_conf:.2f}"
+            cv2.putText(frame, text, (xyxy[0], xyxy[1] - 5), FONT, 0.6, color, LINE_THICKNESS, cv2.LINE_AA)
+
+    def _publish_frame(self, frame, is_camera_open):
+        """Publish stage: hands the annotated frame to the stream and, unless headless, the local window.
+
+        Returns False if the user quit from the window.
+        """
+        # Hand frame to the stream broadcaster (skipped when nobody is watching)
+        if self.broadcaster.has_viewers:
+            self.broadcaster.publish(frame, self._frame_ring)
+
+        # --- CAMERA DISPLAY ---
+        if is_camera_open and not self.headless:
+            cv2.imshow(self.window_name, frame)
+
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                print("\nUser manually quit the protocol.")
+                self.result_status = "USER QUIT"
+                self.running = False
+                return False
+        return True
+
+    def _run_session(self, frames, is_camera_open, render=None, frame_interval=None):
+        """Feeds (frame_index, captured_at, frame, detections) packets through the state machine,
+        overlay and publish stages until the session ends or frames runs out.
+
+        Hold timers are credited the time between capture timestamps (capped at
+        MAX_FRAME_GAP_SECONDS), or a fixed frame_interval for recorded sources.
+        render=None draws only when someone can see it (a window or a stream viewer).
+        The session counts as a producer on the batched inference server only while this runs.
+        """
+        previous_capture = None
+        server = self.inference_server
+        if server is not None:
+            server.register()
+        try:
+            for frame_index, captured_at, frame, detections in frames:
+                if self.current_phase > 6 or self.should_reset or not self.running:
+                    break
+                if frame_interval is not None:
+                    dt = frame_interval
+                else:
+                    dt = min(captured_at - previous_capture, MAX_FRAME_GAP_SECONDS) if previous_capture is not None else 0.0
+                    previous_capture = captured_at
+                self.last_capture_time = captured_at
+                if self.detection_log is not None:
+                    self.detection_log.append(detections)
+
+                # Signal browser to open ONLY after the first real camera frame arrives
+                if is_camera_open and not self.camera_opened_once:
+                    self.camera_opened_once = True
+                    camera_ready.set()
+                    print("✅ First camera frame captured - signaling browser to open")
+
+                # Headless with nobody watching: run the state machine without drawing (evidence is always drawn)
+                draw = render if render is not None else (not self.headless or self.broadcaster.has_viewers or self.evidence is not None)
+                phase = self.current_phase
+                keep_running, seconds = self._timed(self._advance_protocol, frame if draw else None, detections, dt)
+                self.metrics.observe('state_machine', seconds)
+                self._publish_status()
+                published = True
+                if draw:
+                    _, seconds = self._timed(self._draw_detections, frame, detections)
+                    self.metrics.observe('overlay', seconds)
+                    published, seconds = self._timed(self._publish_frame, frame, is_camera_open)
+                    self.metrics.observe('publish', seconds)
+                if self.evidence is not None and frame is not None:
+                    self._record_evidence(frame, frame_index)
+                self._record_frame_done(phase)
+                if not published or not keep_running:
+                    break
+        finally:
+            frames.close()
+            if server is not None:
+                server.unregister()
+
+    def _record_evidence(self, frame, frame_index):
+        """Queues the annotated frame for the evidence video, plus a keyframe on a phase change or verdict."""
+        if self.last_transition == TRANSITION_ADVANCE:
+            self.evidence.keyframe(frame, f"phase{self.protocol.step_phase}_complete", frame_index)
+        elif self.last_transition == TRANSITION_FINISH:
+            label = ''.join(c if c.isalnum() else '_' for c in self.result_status).strip('_')
+            self.evidence.keyframe(frame, label, frame_index)
+        self.evidence.record_frame(frame, self.protocol.elapsed)
+
+    def _replay_frames(self, frames):
+        """Yields packets for recorded frames back to back, with no camera and no pacing sleeps."""
+        for frame_index, frame in enumerate(frames, start=1):
+            captured_at = time.monotonic()
+            yield frame_index, captured_at, frame, self._yolo_detect(frame)
+
+    def replay(self, frames, render=False, record_detections=False, fps=REPLAY_FPS):
+        """Runs one offline session over an iterable of BGR frames as fast as possible.
+
+        Hold timers treat the frames as recorded at fps, however fast they are processed.
+        Returns the final result_status, which stays "RUNNING" if the frames ran out first.
+        With record_detections the per-frame detections are kept in detection_log.
+        """
+        self.load_models()
+        self._reset_session_state()
+        self.detection_log = [] if record_detections else None
+        self._replaying = True
         try:
-            with open(full_path, 'w') as f:
-                json.dump(data, f, indent=4)
-            print(f"✅ Protocol result successfully saved to {full_path}")
-        except Exception as e:
-            print(f"❌ ERROR: Could not save JSON file. Reason: {e}")
+            self._run_session(self._replay_frames(frames), is_camera_open=False, render=render, frame_interval=1.0 / fps)
+        finally:
+            self._replaying = False
+        self._finish_evidence()
+        self._publish_status()
+        return self.result_status
+
+    def replay_detections(self, detection_log, fps=REPLAY_FPS):
+        """Runs one session straight from cached detections: no frames, no models, no drawing.
+
+        The current module thresholds apply, which is what makes threshold sweeps cheap.
+        """
+        self._reset_session_state()
+        self.detection_log = None
+        packets = ((i, None, None, detections) for i, detections in enumerate(detection_log, start=1))
+        self._run_session(packets, is_camera_open=False, render=False, frame_interval=1.0 / fps)
+        return self.result_status
+
+    def close(self):
+        """Releases the camera, flushes the evidence recorder, stops the FaceMesh worker and closes this session's window."""
+        if self.cap:
+            self.cap.release()
+        evidence = self.evidence
+        self._finish_evidence()
+        if evidence is not None:
+            evidence.join()
+        if self.face_mesh_executor is not None:
+            self.face_mesh_executor.shutdown(wait=False)
+        self.inference_server = None
+        if self.window_created:
+            cv2.destroyWindow(self.window_name)
 
     def run_protocol(self):
-        """Main protocol loop that handles camera and session management"""
+        """Main protocol loop that handles camera and session management.
+
+        In pipelined mode capture and inference run on their own threads and this thread only
+        runs the state machine, overlays and display, so the frame rate is bounded by the
+        slowest stage rather than by the sum of all of them.
+        """
         print("--- Starting YOLOv11 Adherence Protocol (Continuous Mode) ---")
-        
+
+        # Models load and warm up while the camera opens; the first session waits for both
+        threading.Thread(target=self.load_models, daemon=True, name=f"model-loader-{self.session_id}").start()
+
         # Outer loop keeps monitor alive for multiple sessions
         while self.running:
-            # Open/reopen camera for new session
-            if self.cap is not None:
-                self.cap.release()
-                print("📷 Releasing previous camera instance")
-                time.sleep(0.5)
-            
-            print("📷 Opening camera...")
-            self.cap = cv2.VideoCapture(self.video_source)
-            is_camera_open = self.cap.isOpened()
-
-            if not is_camera_open:
-                print(f"❌ Error: Could not open video source {self.video_source}. Running in MOCK mode only.")
-                self.obj_model = "MOCK"
-            else:
-                print("✅ Camera opened successfully")
-                if not self.window_created:
-                    try:
-                        cv2.namedWindow('YOLO Medication Monitor (MediaPipe Jaw Check)', cv2.WINDOW_NORMAL)
-                    except Exception:
-                        pass
-                    init_frame = np.zeros((480, 640, 3), dtype=np.uint8)
-                    cv2.putText(init_frame, "Camera ready. Initializing...", (20, 40), FONT, 0.7, (255, 255, 255), 2, cv2.LINE_AA)
-                    cv2.imshow('YOLO Medication Monitor (MediaPipe Jaw Check)', init_frame)
-                    cv2.waitKey(1)
-                    camera_ready.set()
-                    self.window_created = True
-                    self.camera_opened_once = True
+            is_camera_open = self._open_camera()
+            self.models_ready.wait()
 
             # Reset all session variables
-            self.frame_count = 0
-            self.current_phase = 1
-            self.result_status = "RUNNING"
-            face_loss_counter = 0
-            final_confirm_counter = 0
-            phase_4_counter = 0
-            warning_message = ""
-            self.pill_history.clear()
-            self.should_reset = False
-            
-            print(f"🔄 Starting new protocol session (Phase 1)")
+            self._reset_session_state()
 
-            # Inner loop runs the actual protocol
-            while self.current_phase <= 6 and not self.should_reset and self.running:
-                self.frame_count += 1
-                frame = None
-                
-                if is_camera_open:
-                    ret, frame = self.cap.read()
-                    if not ret: 
-                        print("❌ Failed to read frame from camera")
-                        break
-                if frame is None: 
-                    frame = np.zeros((480, 640, 3), dtype=np.uint8)
-
-                h, w, _ = frame.shape
-                warning_message = ""
-
-                detections = self._yolo_detect(frame)
-                vertical_jaw_drop = detections.get('jaw_distance', 0.0)
-
-                status_text = f"Phase {self.current_phase} (Awaiting Action)"
-
-                face_landmarks_found = detections.get('lip_landmarks') is not None
-
-                if self.frame_count > STABILIZATION_FRAMES:
-                    if not face_landmarks_found:
-                        face_loss_counter += 1
-                        if face_loss_counter >= PILL_STATIONARY_FRAMES:
-                            print(f"\n--- ❌ FATAL FAILURE: MOUTH AREA COVERED OR LOST FOR 2 SECONDS ---")
-                            self.result_status = "FATAL FAILURE (MOUTH COVERED)"
-                            break
-                    else:
-                        face_loss_counter = 0
-
-                prompts = {
-                    1: "PHASE 1: Hold medication up.", 
-                    2: "PHASE 2: Open mouth WIDE (Check).",
-                    3: "PHASE 3: Place pill on your tongue.", 
-                    4: "PHASE 4: Close mouth (Check).",
-                    5: "PHASE 5: Open mouth for check.", 
-                    6: "PHASE 6: SWALLOW CHECK..."
-                }
-                prompt_text = prompts.get(self.current_phase, "Protocol Starting...")
-                cv2.putText(frame, prompt_text, (10, 50), FONT, FONT_SCALE, COLOR_PROMPT, LINE_THICKNESS, cv2.LINE_AA)
-
-                if self.current_phase == 1:
-                    if self._check_detection(detections, 'pill', CPill_P1_MIN):
-                        status_text = "SUCCESS: Pill Detected. Advancing..."
-                        self.current_phase = 2
-                    else:
-                        cv2.putText(frame, "Pill NOT Detected!", (10, 90), FONT, FONT_SCALE, COLOR_FAIL, LINE_THICKNESS, cv2.LINE_AA)
-
-                elif self.current_phase == 2:
-                    tongue_present = self._check_detection(detections, 'tongue-no-pill', CTONGUE_MIN)
-                    jaw_open = vertical_jaw_drop > MOUTH_OPEN_THRESHOLD
-
-                    if tongue_present and jaw_open:
-                        status_text = "SUCCESS: Mouth Wide Open. Advancing..."
-                        self.current_phase = 3
-                    else:
-                        cv2.putText(frame, f"Open mouth WIDER! (Drop: {vertical_jaw_drop:.1f}px)", (10, 90), FONT, FONT_SCALE, COLOR_FAIL, LINE_THICKNESS, cv2.LINE_AA)
-
-                elif self.current_phase == 3:
-                    pill_on_tongue_present = self._check_detection(detections, 'pill-on-tongue', CPill_P3_MIN)
-
-                    if pill_on_tongue_present:
-                        current_centroid = self._calculate_centroid(detections['pill-on-tongue'][1])
-                        if current_centroid:
-                            self.pill_history.append(current_centroid)
-                        else:
-                            self.pill_history.clear()
-
-                        if len(self.pill_history) >= PILL_STATIONARY_FRAMES:
-                            status_text = "SUCCESS: Pill Stable (Duration Met). Advancing..."
-                            self.current_phase = 4
-                            self.pill_history.clear()
-                        else:
-                            status_text = f"HOLD: {len(self.pill_history)}/{PILL_STATIONARY_FRAMES} frames steady"
-                    else:
-                        self.pill_history.clear()
-                        cv2.putText(frame, "Place pill on tongue and hold!", (10, 90), FONT, FONT_SCALE, COLOR_FAIL, LINE_THICKNESS, cv2.LINE_AA)
-
-                elif self.current_phase == 4:
-                    tongue_absent_in_frame = self._check_absence(detections, 'tongue-no-pill', CTongue_P4_MAX)
-                    jaw_closed_in_frame = vertical_jaw_drop < MOUTH_CLOSURE_THRESHOLD
-                    pill_on_tongue_conf = detections.get('pill-on-tongue', (0.0, None))[0]
-
-                    if phase_4_counter > 0 and (vertical_jaw_drop > MOUTH_OPEN_THRESHOLD) and (pill_on_tongue_conf < CPill_P3_MIN):
-                        print(f"--- ⚠️ PHASE 4 RESET: Mouth opened wide ({vertical_jaw_drop:.1f}) but no pill on tongue detected ({pill_on_tongue_conf:.2f}). ---")
-                        phase_4_counter = 0
-                        warning_message = "MEDICATION MISSING (Resetting P4)"
-
-                    if tongue_absent_in_frame and jaw_closed_in_frame:
-                        if phase_4_counter < CONCEALMENT_FRAMES:
-                            phase_4_counter += 1
-                            status_text = f"HOLD CLOSE: {phase_4_counter}/{CONCEALMENT_FRAMES} frames"
-                        else:
-                            status_text = "SUCCESS: Mouth Closed. Advancing..."
-                            self.current_phase = 5
-                            phase_4_counter = 0
-                    else:
-                        if phase_4_counter > 0 and not warning_message:
-                            phase_4_counter = 0
-                            warning_message = "Mouth Opened Too Early!"
-
-                        feedback = []
-                        if not tongue_absent_in_frame: feedback.append("Medication Missing!.")
-                        if not jaw_closed_in_frame: feedback.append(f"Jaws not fully closed (Drop: {vertical_jaw_drop:.1f}px).")
-
-                        if not warning_message:
-                            cv2.putText(frame, "Please close your mouth completely!", (10, 90), FONT, 0.7, COLOR_FAIL, LINE_THICKNESS, cv2.LINE_AA)
-                            cv2.putText(frame, f"Failure: {', '.join(feedback)}", (10, 120), FONT, 0.6, COLOR_FAIL, 1, cv2.LINE_AA)
-
-                elif self.current_phase == 5:
-                    pill_on_tongue_conf = detections.get('pill-on-tongue', (0.0, None))[0]
-
-                    if pill_on_tongue_conf >= CPill_P3_MIN:
-                        print(f"\n--- ❌ FATAL FAILURE: PILL DETECTED ON TONGUE AFTER CONCEALMENT ---")
-                        self.result_status = "FATAL FAILURE (PILL REAPPEARED)"
-                        break
+            print(f"🔄 Starting new protocol session (Phase 1){' [pipelined]' if self.pipelined else ''}")
 
-                    if self._check_detection(detections, 'tongue-no-pill', CTONGUE_MIN):
-                        status_text = "SUCCESS: Re-opened mouth. Checking swallow..."
-                        self.current_phase = 6
-                    else:
-                        cv2.putText(frame, "Open mouth wide again and show tongue!", (10, 90), FONT, 0.7, COLOR_FAIL, LINE_THICKNESS, cv2.LINE_AA)
-
-                elif self.current_phase == 6:
-                    tongue_no_pill_confirmed = self._check_detection(detections, 'tongue-no-pill', CTONGUE_MIN)
-                    pill_gone = self._check_absence(detections, 'pill', CPill_P6_MAX)
-
-                    if tongue_no_pill_confirmed and pill_gone:
-                        final_confirm_counter += 1
-
-                        if final_confirm_counter >= FINAL_CONFIRMATION_FRAMES:
-                            status_text = VERIFIED_PASS
-                            print(f"\n--- 🎉 PROTOCOL COMPLETE! {VERIFIED_PASS} ---")
-                            self.result_status = VERIFIED_PASS
-                            break
-                        else:
-                            status_text = f"FINAL CHECK: Hold for {FINAL_CONFIRMATION_FRAMES - final_confirm_counter} more frames."
-
-                    else:
-                        final_confirm_counter = 0
-                        status_text = "FAILURE: Pill still visible! SWALLOW NOW!"
-
-                        feedback = []
-                        if not tongue_no_pill_confirmed: feedback.append("Mouth must be open")
-                        if not pill_gone: feedback.append("Pill is still detected (SWALLOW!)")
-
-                        cv2.putText(frame, status_text, (10, 90), FONT, 0.7, COLOR_FAIL, LINE_THICKNESS, cv2.LINE_AA)
-                        cv2.putText(frame, f"Issue: {', '.join(feedback)}", (10, 120), FONT, 0.6, COLOR_FAIL, 1, cv2.LINE_AA)
-
-                color_final_status = COLOR_STATUS if status_text.startswith("SUCCESS") or status_text == VERIFIED_PASS else (255, 255, 255)
-                cv2.putText(frame, status_text, (10, frame.shape[0] - 10), FONT, 0.7, color_final_status, LINE_THICKNESS, cv2.LINE_AA)
-
-                if warning_message:
-                    cv2.putText(frame, warning_message, (10, 90), FONT, 0.7, COLOR_FAIL, LINE_THICKNESS, cv2.LINE_AA)
-
-            if detections.get('lip_landmarks'):
-                landmarks = detections['lip_landmarks']
-                UL_X = int(landmarks[UPPER_LIP_ID].x * w); UL_Y = int(landmarks[UPPER_LIP_ID].y * h)
-                LL_X = int(landmarks[LOWER_LIP_ID].x * w); LL_Y = int(landmarks[LOWER_LIP_ID].y * h)
-
-                cv2.circle(frame, (UL_X, UL_Y), 3, (0, 0, 255), -1)
-                cv2.circle(frame, (LL_X, LL_Y), 3, (0, 255, 0), -1)
-                cv2.line(frame, (UL_X, UL_Y), (LL_X, LL_Y), (255, 255, 0), 1)
-
-                vertical_jaw_drop = detections.get('jaw_distance', 0.0)
-                cv2.putText(frame, f"Drop: {vertical_jaw_drop:.1f} px (Target < {MOUTH_CLOSURE_THRESHOLD})", (10, h - 30), FONT, 0.5, (0, 255, 255), 1, cv2.LINE_AA)
-
-            mouth_conf, mouth_bbox = detections.get('mouth', (0.0, None))
-            if mouth_conf >= 0.5:
-                xyxy = _convert_bbox_to_xyxy(mouth_bbox); color = (255, 100, 0)
-                cv2.rectangle(frame, (xyxy[0], xyxy[1]), (xyxy[2], xyxy[3]), color, 1)
-                text = f"Mouth: {mouth_conf:.2f}"
-                cv2.putText(frame, text, (xyxy[0], xyxy[3] + 15), FONT, 0.5, color, 1, cv2.LINE_AA)
-
-            pill_on_tongue_conf, pill_on_tongue_bbox = detections.get('pill-on-tongue', (0.0, None))
-            if pill_on_tongue_conf >= 0.1:
-                xyxy = _convert_bbox_to_xyxy(pill_on_tongue_bbox); color = (255, 0, 255)
-                cv2.rectangle(frame, (xyxy[0], xyxy[1]), (xyxy[2], xyxy[3]), color, LINE_THICKNESS)
-                text = f"P-on-T: {pill_on_tongue_conf:.2f}"
-                cv2.putText(frame, text, (xyxy[0], xyxy[1] - 5), FONT, 0.6, color, LINE_THICKNESS, cv2.LINE_AA)
-
-            pill_conf, pill_bbox = detections.get('pill', (0.0, None))
-            if pill_conf >= 0.7 and self.current_phase < 4:
-                xyxy = _convert_bbox_to_xyxy(pill_bbox); color = (0, 255, 255)
-                cv2.rectangle(frame, (xyxy[0], xyxy[1]), (xyxy[2], xyxy[3]), color, LINE_THICKNESS)
-                text = f"Pill: {pill_conf:.2f}"
-                cv2.putText(frame, text, (xyxy[0], xyxy[1] - 5), FONT, 0.6, color, LINE_THICKNESS, cv2.LINE_AA)
-
-            # Store frame for Flask streaming (always update)
-            with monitor_lock:
-                self.current_frame = frame.copy()
-
-            # --- CAMERA DISPLAY ---
-            if is_camera_open:
-                cv2.imshow('YOLO Medication Monitor (MediaPipe Jaw Check)', frame)
-                
-                # Signal browser to open ONLY after first successful camera window display
-                if not self.camera_opened_once:
-                    self.camera_opened_once = True
-                    camera_ready.set()
-                    print("✅ Camera window opened - signaling browser to open")
-                
-                if cv2.waitKey(1) & 0xFF == ord('q'):
-                    print("\nUser manually quit the protocol.")
-                    self.result_status = "USER QUIT"
-                    self.running = False
-                    break
+            # Inner loop runs the actual protocol
+            frames = self._pipelined_frames(is_camera_open) if self.pipelined else self._sequential_frames(is_camera_open)
+            self._run_session(frames, is_camera_open)
 
-            time.sleep(0.03)
+            # Session ended - save results
+            self._publish_status()
+            self.save_result_to_json()
+            print(f"\n--- SESSION ENDED: {self.result_status} ---")
 
-        # Session ended - save results
-        self.save_result_to_json()
-        print(f"\n--- SESSION ENDED: {self.result_status} ---")
-        
-        # If should_reset is True, loop continues for new session
-        # Otherwise, wait for reset signal
-        if not self.should_reset and self.running:
-            print("⏸️  Waiting for new session request...")
-            while not self.should_reset and self.running:
-                time.sleep(0.1)
+            # If should_reset is True, loop continues for new session
+            # Otherwise, wait for reset signal
+            if not self.should_reset and self.running:
+                print("⏸️  Waiting for new session request...")
+                while not self.should_reset and self.running:
+                    time.sleep(0.1)
 
         # Cleanup
-        if self.cap:
-            self.cap.release()
-        cv2.destroyAllWindows()
+        self.close()
         print("--- PROTOCOL MONITOR STOPPED ---")
 
 
+class SessionManager:
+    """Owns one YOLOv11MedicationMonitor per bedside camera, keyed by session id.
+
+    Each session has its own protocol thread and state; all of them share the loaded YOLO model.
+    """
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def create(self, session_id, video_source, max_sessions=None, **monitor_kwargs):
+        """Starts a new session on video_source. Returns None if session_id is already in use or
+        max_sessions sessions are already running."""
+        with self._lock:
+            if session_id in self._sessions:
+                return None
+            if max_sessions is not None and len(self._sessions) >= max_sessions:
+                return None
+            session = YOLOv11MedicationMonitor(
+                obj_weights_path=monitor_kwargs.pop('obj_weights_path', YOLO_OBJ_WEIGHT_PATH),
+                video_source=video_source,
+                session_id=session_id,
+                **monitor_kwargs
+            )
+            self._sessions[session_id] = session
+
+        threading.Thread(target=session.run_protocol, daemon=True, name=f"protocol-{session_id}").start()
+        print(f"✅ Session '{session_id}' started on video source {video_source}")
+        return session
+
+    def get(self, session_id):
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def remove(self, session_id):
+        """Stops a session's protocol loop and forgets it. Returns False if it did not exist."""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is None:
+            return False
+        session.running = False
+        print(f"🛑 Session '{session_id}' stopped")
+        return True
+
+    def list(self):
+        with self._lock:
+            return list(self._sessions.values())
+
+
+session_manager = SessionManager()
+
+
 # --- Flask Routes ---
 @app.route('/')
 def index():
     return jsonify({"status": "Flask backend running"})
 
 
-def generate_frames():
-    """Generator function for video streaming"""
-    global monitor
+def placeholder_jpeg():
+    """The JPEG streamed while there is no session to show."""
+    ret, buffer = cv2.imencode('.jpg', _placeholder_frame())
+    return buffer.tobytes() if ret else b''
+
+
+def generate_frames(session=None, params=DEFAULT_STREAM_PARAMS, max_fps=None):
+    """Generator function for video streaming.
+
+    Every client shares the session's FrameBroadcaster, so a frame is encoded once per distinct
+    params no matter how many clients are connected; each client only yields when a newer frame
+    exists, and at most max_fps times a second. When writing a frame blocks for more than
+    STREAM_SLOW_WRITE_SECONDS the client is moved to a lower quality, and back up once it keeps up.
+    """
+    broadcaster = session.broadcaster if session else None
+    if broadcaster is None:
+        placeholder = placeholder_jpeg()
+        while True:
+            yield (b'--frame\r\n'
+                   b'Content-Type: image/jpeg\r\n\r\n' + placeholder + b'\r\n')
+            time.sleep(STREAM_IDLE_RESEND_SECONDS)
+
+    current = params
+    quality_control = StreamQualityController(params)
+    pacer = FramePacer(max_fps) if max_fps else None
+    broadcaster.subscribe(current)
+    try:
+        last_seq = -1
+        while True:
+            last_seq, frame_bytes = broadcaster.wait_for_jpeg(last_seq, current)
+            if frame_bytes is None:
+                continue
+            started = time.monotonic()
+            yield (b'--frame\r\n'
+                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+
+            # The yield returns once the server has handed the bytes to the socket, so a long
+            # wait here means the client is not draining it
+            next_params = quality_control.after_write(time.monotonic() - started)
+            if next_params != current:
+                broadcaster.unsubscribe(current)
+                current = next_params
+                broadcaster.subscribe(current)
+            if pacer is not None:
+                pacer.wait()
+    finally:
+        broadcaster.unsubscribe(current)
+
+
+def parse_stream_params(args):
+    """Per-client stream settings from query arguments (a name -> string mapping): width, height,
+    quality, fps.
+
+    Returns (StreamParams, max_fps); anything not given (or invalid) keeps the full-size,
+    default-quality, uncapped stream.
+    """
+    def number(name, cast):
+        try:
+            value = cast(args[name])
+        except (KeyError, TypeError, ValueError):
+            return None
+        return value if value > 0 else None
+
+    quality = number('quality', int) or STREAM_DEFAULT_QUALITY
+    params = StreamParams(number('width', int), number('height', int), max(STREAM_MIN_QUALITY, min(100, quality)))
+    return params, number('fps', float)
+
+
+def _stream_request_params():
+    return parse_stream_params(request.args)
+
+
+def status_payload(session):
+    """The /status_update body for session (None: no session running)."""
+    if session:
+        return {
+            "result_status": session.result_status,
+            "current_phase": session.current_phase
+        }
+    return {
+        "result_status": "DISCONNECTED",
+        "current_phase": 0
+    }
+
+
+def generate_status_events(session=None):
+    """Server-sent events for one client: the current status at once, then one event per change.
+
+    A comment line goes out every STATUS_HEARTBEAT_SECONDS so proxies keep the connection open.
+    """
+    if session is None:
+        yield f"data: {json.dumps(status_payload(None))}\n\n"
+        return
+
+    last_version = -1
     while True:
-        with monitor_lock:
-            if monitor and monitor.current_frame is not None:
-                frame = monitor.current_frame.copy()
-            else:
-                # Create a blank frame if no frame available
-                frame = np.zeros((480, 640, 3), dtype=np.uint8)
-                cv2.putText(frame, "Waiting for camera...", (50, 240), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-        
-        ret, buffer = cv2.imencode('.jpg', frame)
-        if not ret:
+        version, snapshot = session.status.wait_for_change(last_version)
+        if version == last_version:
+            yield ": keepalive\n\n"
             continue
-            
-        frame_bytes = buffer.tobytes()
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-        
-        time.sleep(0.033)  # ~30 FPS
+        last_version = version
+        yield status_event(version, snapshot)
+
+
+def status_event(version, snapshot):
+    """One /status_stream server-sent event."""
+    return f"id: {version}\ndata: {json.dumps(snapshot)}\n\n"
+
+
+def _status_stream_response(session):
+    return Response(generate_status_events(session), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def reset_session(session):
+    """Flags session for a restart. Returns the (payload, http_status) /reset answers with."""
+    if session:
+        # Set reset flag to trigger protocol restart
+        session.should_reset = True
+        print(f"🔄 Protocol reset requested by user (session '{session.session_id}')")
+        return {"status": "success", "message": "Protocol reset initiated"}, 200
+    return {"status": "error", "message": "Monitor not initialized"}, 500
+
+
+def _reset_session(session):
+    payload, status = reset_session(session)
+    return jsonify(payload), status
 
 
 @app.route('/video_feed')
 def video_feed():
-    return Response(generate_frames(),
+    """MJPEG stream of the default session. Optional query: width / height (max size), quality, fps (cap)."""
+    with monitor_lock:
+        session = monitor
+    params, max_fps = _stream_request_params()
+    return Response(generate_frames(session, params, max_fps),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
 
 @app.route('/status_update')
 def status_update():
-    global monitor
     with monitor_lock:
-        if monitor:
-            return jsonify({
-                "result_status": monitor.result_status,
-                "current_phase": monitor.current_phase
-            })
-        else:
-            return jsonify({
-                "result_status": "DISCONNECTED",
-                "current_phase": 0
-            })
+        return jsonify(status_payload(monitor))
+
+
+@app.route('/status_stream')
+def status_stream():
+    """Push counterpart of /status_update (which stays for polling clients)."""
+    with monitor_lock:
+        session = monitor
+    return _status_stream_response(session)
 
 
 @app.route('/reset', methods=['POST'])
 def reset_protocol():
     """Reset the protocol to start over"""
-    global monitor
     with monitor_lock:
-        if monitor:
-            # Set reset flag to trigger protocol restart
-            monitor.should_reset = True
-            print("🔄 Protocol reset requested by user")
-            return jsonify({"status": "success", "message": "Protocol reset initiated"})
-        else:
-            return jsonify({"status": "error", "message": "Monitor not initialized"}), 500
+        return _reset_session(monitor)
+
+
+@app.route('/inference_stats')
+def inference_stats():
+    """Per-model micro-batch sizes and queue waits from the batched inference servers."""
+    with _yolo_models_lock:
+        servers = dict(_inference_servers)
+    return jsonify({path: server.stats() for path, server in servers.items()})
+
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint: per-session stage latencies, FPS, drops and phase dwell, plus
+    the batched inference servers' batch sizes and queue waits."""
+    families = {}
+    for session in session_manager.list():
+        session.metrics.collect(families, {"session": session.session_id})
+        startup = families.setdefault("proto_startup_seconds", ("gauge", "Model load and warm-up time of each startup step.", []))[2]
+        for step, ms in session.startup_timings.items():
+            startup.append(("", {"session": session.session_id, "step": step.removesuffix("_ms")}, ms / 1000))
+        clients = families.setdefault("proto_stream_clients", ("gauge", "Stream clients per encoder (max size and JPEG quality).", []))[2]
+        for params, count in session.broadcaster.stream_params().items():
+            clients.append(("", {"session": session.session_id, "width": str(params.max_width or "full"),
+                                 "height": str(params.max_height or "full"), "quality": str(params.quality)}, count))
+
+    with _yolo_models_lock:
+        servers = dict(_inference_servers)
+    for path, server in servers.items():
+        stats = server.stats()
+        labels = {"model": os.path.basename(path)}
+        families.setdefault("proto_inference_batches_total", ("counter", "Micro-batches run by the batched inference server.", []))[2].append(("", labels, stats["batches_run"]))
+        families.setdefault("proto_inference_frames_total", ("counter", "Frames run by the batched inference server.", []))[2].append(("", labels, stats["frames_run"]))
+        families.setdefault("proto_inference_mean_batch_size", ("gauge", "Mean size of recent micro-batches.", []))[2].append(("", labels, stats["mean_batch_size"]))
+        waits = families.setdefault("proto_inference_queue_wait_seconds", ("summary", "Queue wait before a frame's batch ran (quantiles over recent frames).", []))[2]
+        for quantile, key in (("0.5", "p50"), ("0.95", "p95"), ("1", "max")):
+            waits.append(("", {**labels, "quantile": quantile}, stats["queue_wait_ms"][key] / 1000))
+        waits.append(("_sum", labels, stats["queue_wait_seconds_total"]))
+        waits.append(("_count", labels, stats["frames_run"]))
+
+    return Response(_format_prometheus(families), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/ready')
+def ready():
+    """Readiness probe: 200 once every session's models are loaded and warmed up, 503 until then."""
+    sessions = {session.session_id: session.readiness() for session in session_manager.list()}
+    is_ready = bool(sessions) and all(state["ready"] for state in sessions.values())
+    return jsonify({"ready": is_ready, "sessions": sessions}), 200 if is_ready else 503
+
+
+@app.route('/reports')
+def reports():
+    """Session reports, oldest first. Query: since / until (ISO timestamps), session, limit."""
+    limit = request.args.get('limit', type=int)
+    return jsonify(report_writer.query(
+        since=request.args.get('since'),
+        until=request.args.get('until'),
+        session_id=request.args.get('session'),
+        limit=limit
+    ))
+
+
+@app.route('/reports/rollup')
+def reports_rollup():
+    """Per-day report counts, verdict counts and time range from the report index."""
+    return jsonify(report_writer.rollup())
+
+
+@app.route('/sessions', methods=['GET'])
+def list_sessions():
+    return jsonify([
+        {"session_id": session.session_id, "video_source": session.video_source, **status_payload(session)}
+        for session in session_manager.list()
+    ])
+
+
+def parse_video_source(value):
+    """A POST /sessions video_source: a camera index (int or digit string) or one of
+    ALLOWED_VIDEO_SOURCES. Returns None for anything else, so clients cannot make the server
+    open arbitrary files or URLs."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value if value >= 0 else None
+    if isinstance(value, str):
+        if value.isdigit():
+            return int(value)
+        if value in ALLOWED_VIDEO_SOURCES:
+            return value
+    return None
+
+
+@app.route('/sessions', methods=['POST'])
+def create_session():
+    """Starts a session. Body: {"session_id": "bed-3", "video_source": 2}"""
+    body = request.get_json(silent=True) or {}
+    session_id = str(body.get('session_id', '')).strip()
+    video_source = parse_video_source(body.get('video_source', 0))
+    if not session_id:
+        return jsonify({"status": "error", "message": "session_id is required"}), 400
+    if video_source is None:
+        return jsonify({"status": "error", "message": "video_source must be a camera index or an allowed source"}), 400
+    if session_manager.create(session_id, video_source, max_sessions=MAX_SESSIONS) is None:
+        if session_manager.get(session_id) is not None:
+            return jsonify({"status": "error", "message": f"Session '{session_id}' already exists"}), 409
+        return jsonify({"status": "error", "message": f"At most {MAX_SESSIONS} sessions can run at once"}), 429
+    return jsonify({"status": "success", "session_id": session_id}), 201
+
+
+@app.route('/sessions/<session_id>', methods=['DELETE'])
+def delete_session(session_id):
+    with monitor_lock:
+        is_default = monitor is not None and session_manager.get(session_id) is monitor
+    if is_default:
+        # The legacy routes would keep serving the stopped session; /reset restarts it instead
+        return jsonify({"status": "error", "message": f"Session '{session_id}' serves the default routes and cannot be stopped"}), 409
+    if not session_manager.remove(session_id):
+        return jsonify({"status": "error", "message": f"Unknown session '{session_id}'"}), 404
+    return jsonify({"status": "success", "message": f"Session '{session_id}' stopped"})
+
+
+@app.route('/sessions/<session_id>/video_feed')
+def session_video_feed(session_id):
+    session = session_manager.get(session_id)
+    if session is None:
+        return jsonify({"status": "error", "message": f"Unknown session '{session_id}'"}), 404
+    params, max_fps = _stream_request_params()
+    return Response(generate_frames(session, params, max_fps),
+                    mimetype='multipart/x-mixed-replace; boundary=frame')
+
+
+@app.route('/sessions/<session_id>/status_update')
+def session_status_update(session_id):
+    session = session_manager.get(session_id)
+    if session is None:
+        return jsonify({"status": "error", "message": f"Unknown session '{session_id}'"}), 404
+    return jsonify(status_payload(session))
+
+
+@app.route('/sessions/<session_id>/status_stream')
+def session_status_stream(session_id):
+    session = session_manager.get(session_id)
+    if session is None:
+        return jsonify({"status": "error", "message": f"Unknown session '{session_id}'"}), 404
+    return _status_stream_response(session)
+
+
+@app.route('/sessions/<session_id>/reset', methods=['POST'])
+def session_reset(session_id):
+    session = session_manager.get(session_id)
+    if session is None:
+        return jsonify({"status": "error", "message": f"Unknown session '{session_id}'"}), 404
+    return _reset_session(session)
 
 
 def open_browser():
-    """Open browser ONLY after camera window is confirmed open"""
-    print("⏳ Waiting for camera window to open before launching browser...")
-    camera_ready.wait()  # Block until camera window opens
+    """Open browser ONLY after the camera is confirmed to be delivering frames"""
+    print("⏳ Waiting for the first camera frame before launching browser...")
+    camera_ready.wait()  # Block until the camera delivers a frame
     time.sleep(0.5)  # Small delay to ensure window is stable
     monitor_url = "https://850180c3-60a2-4930-a17f-4f1427dc94ce.lovableproject.com/monitor"
     print(f"🌐 Opening browser to: {monitor_url}")
@@ -562,21 +2960,21 @@ if __name__ == "__main__":
     print("🚀 Starting Medication Adherence Protocol System")
     print("=" * 60)
     
-    # Initialize monitor
-    monitor = YOLOv11MedicationMonitor(
-        obj_weights_path=YOLO_OBJ_WEIGHT_PATH,
+    # Initialize the default session (served by the legacy routes) and start its protocol thread
+    monitor = session_manager.create(
+        DEFAULT_SESSION_ID,
         video_source=0,
+        obj_weights_path=YOLO_OBJ_WEIGHT_PATH,
         max_frames=200
     )
-    
-    # Start protocol in separate thread
-    protocol_thread = threading.Thread(target=monitor.run_protocol, daemon=True)
-    protocol_thread.start()
     print("✅ Protocol thread started")
     
-    # Start browser opener in separate thread
-    browser_thread = threading.Thread(target=open_browser, daemon=True)
-    browser_thread.start()
+    # Start browser opener in separate thread (a headless server has no local browser to open)
+    if not HEADLESS_MODE:
+        browser_thread = threading.Thread(target=open_browser, daemon=True)
+        browser_thread.start()
+    else:
+        print("🖥️  Headless mode: no local window or browser; watch via /video_feed")
     
     # Start Flask server
     print("✅ Starting Flask server on http://localhost:5000")
@@ -0,0 +1,142 @@
+"""Offline replay and benchmark harness for the adherence protocol.
+
+Drives YOLOv11MedicationMonitor from recorded clips (video files or directories of images)
+as fast as the models allow, with no camera and no real-time sleeps, and reports frames/sec,
+per-stage latency and the final result_status for each clip.
+
+    python replay.py clips/*.mp4 clips/bed3_session/ --weights best.pt
+    python replay.py clips/*.mp4 --mock --json bench.json --expect expected.json --min-fps 200
+    python replay.py clips/*.mp4 --weights best.pt --cache-dir detection_cache/
+
+--mock uses the existing _get_mock_detections path (with stub lip landmarks, so sessions run
+through all six phases), so CI on a CPU-only box can catch changes in verdicts (--expect) and
+throughput regressions (--min-fps) without weights.
+--cache-dir saves each clip's per-frame detections for threshold sweeps with sweep.py.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+
+import proto
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def iter_clip_frames(path):
+    """Yields BGR frames from a video file, or from the images in a directory in name order."""
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                frame = cv2.imread(os.path.join(path, name))
+                if frame is not None:
+                    yield frame
+        return
+
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open clip {path}")
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                return
+            yield frame
+    finally:
+        cap.release()
+
+
+def replay_clip(path, weights_path, render=False, cache_dir=None, keep_detections=False, **monitor_kwargs):
+    """Replays one clip in a fresh session and returns its benchmark record.
+
+    With cache_dir the clip's detections are also saved there as <clip name>.npz; with
+    keep_detections they are returned under record["detection_log"].
+    """
+    clip_name = os.path.basename(os.path.normpath(path))
+    monitor = proto.YOLOv11MedicationMonitor(
+        obj_weights_path=weights_path,
+        video_source=path,
+        session_id=f"replay:{clip_name}",
+        headless=True,
+        batched_inference=False,  # One session gains nothing from the shared batching server
+        **monitor_kwargs
+    )
+    try:
+        start = time.perf_counter()
+        result_status = monitor.replay(iter_clip_frames(path), render=render,
+                                       record_detections=cache_dir is not None or keep_detections)
+        wall_seconds = time.perf_counter() - start
+    finally:
+        monitor.close()
+
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        cache_path = os.path.join(cache_dir, f"{os.path.splitext(clip_name)[0]}.npz")
+        proto.save_detection_cache(cache_path, monitor.detection_log, clip=path, weights=weights_path, result_status=result_status)
+        print(f"✅ Detections for {clip_name} cached to {cache_path}")
+
+    record = {
+        "clip": path,
+        "result_status": result_status,
+        "final_phase": monitor.current_phase,
+        "frames": monitor.frame_count,
+        "wall_seconds": wall_seconds,
+        "fps": monitor.frame_count / wall_seconds if wall_seconds > 0 else 0.0,
+        "stages": monitor.metrics.summary(),
+    }
+    if keep_detections:
+        record["detection_log"] = monitor.detection_log
+    return record
+
+
+def print_report(records):
+    print(f"{'clip':<40} {'frames':>7} {'fps':>9}  result_status")
+    for record in records:
+        print(f"{os.path.basename(os.path.normpath(record['clip'])):<40} {record['frames']:>7} {record['fps']:>9.1f}  {record['result_status']}")
+        for stage, stats in record["stages"].items():
+            print(f"    {stage:<14} n={stats['count']:<6} mean={stats['mean_ms']:7.2f} ms  p95<={stats['p95_ms']:g} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded clips through the adherence protocol and benchmark it.")
+    parser.add_argument("clips", nargs="+", help="Video files or directories of images")
+    parser.add_argument("--weights", default=proto.YOLO_OBJ_WEIGHT_PATH, help="YOLO weights to load")
+    parser.add_argument("--mock", action="store_true", help="Use the MOCK detection path instead of loading weights")
+    parser.add_argument("--render", action="store_true", help="Also run the overlay stage (as if a viewer were connected)")
+    parser.add_argument("--cache-dir", help="Save each clip's per-frame detections here (for sweep.py)")
+    parser.add_argument("--json", dest="json_path", help="Write the benchmark records to this file")
+    parser.add_argument("--expect", help="JSON file mapping clip path to expected result_status")
+    parser.add_argument("--min-fps", type=float, default=0.0, help="Fail if any clip replays slower than this")
+    args = parser.parse_args(argv)
+
+    weights_path = "MOCK" if args.mock else args.weights
+    records = [replay_clip(path, weights_path, render=args.render, cache_dir=args.cache_dir) for path in args.clips]
+    print_report(records)
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(records, f, indent=4)
+        print(f"✅ Benchmark written to {args.json_path}")
+
+    failures = []
+    if args.expect:
+        with open(args.expect) as f:
+            expected = json.load(f)
+        for record in records:
+            want = expected.get(record["clip"])
+            if want is not None and want != record["result_status"]:
+                failures.append(f"{record['clip']}: expected {want!r}, got {record['result_status']!r}")
+    for record in records:
+        if record["fps"] < args.min_fps:
+            failures.append(f"{record['clip']}: {record['fps']:.1f} fps is below --min-fps {args.min_fps:g}")
+
+    for failure in failures:
+        print(f"❌ {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -20,8 +20,60 @@ const Monitor = () => {
   const hasShownConnectedToast = useRef(false);
   const hasShownDisconnectedToast = useRef(false);
 
+  const isConnectedRef = useRef(false);
+
   useEffect(() => {
-    // Poll backend for status updates
+    const markConnected = () => {
+      if (isConnectedRef.current) return;
+      isConnectedRef.current = true;
+      setIsConnected(true);
+      if (!hasShownConnectedToast.current) {
+        toast({
+          title: "Connected to Flask Backend",
+          description: "Live monitoring active",
+        });
+        hasShownConnectedToast.current = true;
+        hasShownDisconnectedToast.current = false;
+      }
+    };
+
+    const markDisconnected = () => {
+      if (!isConnectedRef.current) return;
+      isConnectedRef.current = false;
+      setIsConnected(false);
+      if (!hasShownDisconnectedToast.current) {
+        toast({
+          title: "Connection Lost",
+          description: "Reconnecting to Flask backend...",
+          variant: "destructive",
+        });
+        hasShownDisconnectedToast.current = true;
+        hasShownConnectedToast.current = false;
+      }
+      setProtocolStatus("DISCONNECTED");
+      setCurrentPhase("Backend not connected");
+    };
+
+    const applyStatus = (data: { result_status?: string; current_phase?: number | string }) => {
+      setProtocolStatus(data.result_status || "RUNNING");
+
+      // Handle phase - can be either number or string
+      const phase = data.current_phase;
+      if (typeof phase === 'number') {
+        setPhaseCount(phase);
+        setCurrentPhase(`Phase ${phase}`);
+      } else if (typeof phase === 'string') {
+        setCurrentPhase(phase);
+        const phaseMatch = phase.match(/Phase (\d+)/);
+        if (phaseMatch) {
+          setPhaseCount(parseInt(phaseMatch[1]));
+        }
+      } else {
+        setCurrentPhase("Monitoring...");
+      }
+    };
+
+    // Poll backend for status updates (fallback while the push stream is unavailable)
     const pollStatus = async () => {
       try {
         const response = await fetch(`${backendUrl}/status_update`);
@@ -33,63 +85,59 @@ const Monitor = () => {
         connectionStableCount.current++;
         disconnectionCount.current = 0;
         
-        if (!isConnected && connectionStableCount.current >= 2) {
-          setIsConnected(true);
-          if (!hasShownConnectedToast.current) {
-            toast({
-              title: "Connected to Flask Backend",
-              description: "Live monitoring active",
-            });
-            hasShownConnectedToast.current = true;
-            hasShownDisconnectedToast.current = false;
-          }
+        if (connectionStableCount.current >= 2) {
+          markConnected();
         }
         
-        setProtocolStatus(data.result_status || "RUNNING");
-        
-        // Handle phase - can be either number or string
-        const phase = data.current_phase;
-        if (typeof phase === 'number') {
-          setPhaseCount(phase);
-          setCurrentPhase(`Phase ${phase}`);
-        } else if (typeof phase === 'string') {
-          setCurrentPhase(phase);
-          const phaseMatch = phase.match(/Phase (\d+)/);
-          if (phaseMatch) {
-            setPhaseCount(parseInt(phaseMatch[1]));
-          }
-        } else {
-          setCurrentPhase("Monitoring...");
-        }
+        applyStatus(data);
       } catch (error) {
         // Disconnection stability check - require 3 consecutive failures
         disconnectionCount.current++;
         connectionStableCount.current = 0;
         
-        if (isConnected && disconnectionCount.current >= 3) {
-          setIsConnected(false);
-          if (!hasShownDisconnectedToast.current) {
-            toast({
-              title: "Connection Lost",
-              description: "Reconnecting to Flask backend...",
-              variant: "destructive",
-            });
-            hasShownDisconnectedToast.current = true;
-            hasShownConnectedToast.current = false;
-          }
-          setProtocolStatus("DISCONNECTED");
-          setCurrentPhase("Backend not connected");
+        if (disconnectionCount.current >= 3) {
+          markDisconnected();
         }
       }
     };
 
-    // Initial connection
-    pollStatus();
-    
-    // Poll every 500ms for real-time updates
-    const interval = setInterval(pollStatus, 500);
+    let interval: ReturnType<typeof setInterval> | null = null;
+    const startPolling = () => {
+      if (interval) return;
+      pollStatus();
+      // Poll every 500ms for real-time updates
+      interval = setInterval(pollStatus, 500);
+    };
+    const stopPolling = () => {
+      if (interval) clearInterval(interval);
+      interval = null;
+    };
 
-    return () => clearInterval(interval);
+    if (typeof EventSource === 'undefined') {
+      startPolling();
+      return stopPolling;
+    }
+
+    // Server pushes status only when it changes; EventSource reconnects on its own
+    const events = new EventSource(`${backendUrl}/status_stream`);
+    events.onopen = () => {
+      stopPolling();
+      connectionStableCount.current = 0;
+      disconnectionCount.current = 0;
+      markConnected();
+    };
+    events.onmessage = (event) => {
+      applyStatus(JSON.parse(event.data));
+    };
+    events.onerror = () => {
+      // Keep polling (and detecting disconnects) until the stream comes back
+      startPolling();
+    };
+
+    return () => {
+      events.close();
+      stopPolling();
+    };
   }, [backendUrl, toast]);
 
   const handleReset = async () => {
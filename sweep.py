@@ -0,0 +1,136 @@
+"""Threshold sweeps over cached detections, without rerunning YOLO or FaceMesh.
+
+Record the caches once with `python replay.py clips/*.mp4 --cache-dir detection_cache/`, then
+step the phase state machine straight from them for every combination of thresholds:
+
+    python sweep.py detection_cache/*.npz --grid CPill_P1_MIN=0.6,0.7,0.8 \
+        --grid MOUTH_OPEN_THRESHOLD=15,20,25 --expect expected.json --workers 8
+
+Each combination runs in a worker process with the module-level thresholds in proto set to
+its values, so any of the tuning constants (CPill_P1_MIN, CTONGUE_MIN, MOUTH_OPEN_THRESHOLD,
+STABILITY_THRESHOLD, PILL_STATIONARY_SECONDS, ...) can be swept. Values are Python literals
+(17.5, 20, True). --expect may be keyed by cache path or by clip path, so replay.py's
+expectations file works as is.
+"""
+import argparse
+import ast
+import collections
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import proto
+
+# Per-process state: caches are loaded once per worker, not once per combination
+_caches = None
+_monitor = None
+
+
+def _load_caches(cache_paths):
+    global _caches
+    _caches = [(path, proto.load_detection_cache(path)[0]) for path in cache_paths]
+
+
+def run_combination(params):
+    """Sets the thresholds in params and replays every cached session. Returns {cache: result_status}."""
+    global _monitor
+    for name, value in params.items():
+        setattr(proto, name, value)
+    # The monitor sizes pill_history from PILL_STATIONARY_SECONDS, so rebuild it if that is swept
+    if _monitor is None or 'PILL_STATIONARY_SECONDS' in params:
+        _monitor = proto.YOLOv11MedicationMonitor(obj_weights_path="MOCK", session_id="sweep", headless=True,
+                                                  concurrent_detection=False, batched_inference=False)
+    return {path: _monitor.replay_detections(detection_log) for path, detection_log in _caches}
+
+
+def parse_value(name, text):
+    """Parses one grid value as a Python literal, so 17.5 stays a float even for an int constant."""
+    current = getattr(proto, name)
+    try:
+        value = ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        if isinstance(current, str):
+            return text
+        raise SystemExit(f"{name}: cannot parse {text!r}")
+    if isinstance(current, bool) != isinstance(value, bool):
+        raise SystemExit(f"{name} is {type(current).__name__}, got {text!r}")
+    return value
+
+
+def parse_grid(specs):
+    """Turns ["NAME=v1,v2", ...] into a list of {NAME: value} combinations."""
+    axes = []
+    for spec in specs:
+        name, _, values = spec.partition('=')
+        if not hasattr(proto, name):
+            raise SystemExit(f"Unknown threshold {name!r}")
+        axes.append([(name, parse_value(name, value)) for value in values.split(',')])
+    return [dict(combination) for combination in itertools.product(*axes)]
+
+
+def expected_by_cache(cache_paths, expected):
+    """Maps each cache path to its expected result_status, looked up by cache path or by the clip
+    path recorded in the cache's metadata (how replay.py --expect files are keyed)."""
+    resolved = {}
+    for path in cache_paths:
+        if path in expected:
+            resolved[path] = expected[path]
+            continue
+        clip = proto.load_detection_cache(path)[1].get("clip")
+        if clip in expected:
+            resolved[path] = expected[clip]
+    return resolved
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep protocol thresholds over cached detections.")
+    parser.add_argument("caches", nargs="+", help=".npz detection caches written by replay.py --cache-dir")
+    parser.add_argument("--grid", action="append", default=[], help="NAME=v1,v2,... (repeatable)")
+    parser.add_argument("--expect", help="JSON file mapping cache path to expected result_status")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes")
+    parser.add_argument("--json", dest="json_path", help="Write every combination's verdicts to this file")
+    args = parser.parse_args(argv)
+
+    combinations = parse_grid(args.grid) or [{}]
+    expected = {}
+    if args.expect:
+        with open(args.expect) as f:
+            expected = expected_by_cache(args.caches, json.load(f))
+        if not expected:
+            print(f"⚠️ No cache in the sweep matches a path in {args.expect}; accuracy is not scored")
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_load_caches, initargs=(args.caches,)) as pool:
+        results = list(pool.map(run_combination, combinations))
+    elapsed = time.perf_counter() - start
+
+    rows = []
+    for params, verdicts in zip(combinations, results):
+        scored = [path for path in verdicts if path in expected]
+        correct = sum(verdicts[path] == expected[path] for path in scored)
+        rows.append({
+            "params": params,
+            "verdict_counts": dict(collections.Counter(verdicts.values())),
+            "accuracy": correct / len(scored) if scored else None,
+            "verdicts": verdicts,
+        })
+
+    if expected:
+        rows.sort(key=lambda row: -1.0 if row["accuracy"] is None else row["accuracy"], reverse=True)
+    for row in rows:
+        accuracy = f"{row['accuracy']:.1%}" if row["accuracy"] is not None else "-"
+        print(f"{accuracy:>7}  {row['params']}  {row['verdict_counts']}")
+    print(f"✅ {len(combinations)} combinations x {len(args.caches)} sessions in {elapsed:.2f}s")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(rows, f, indent=4)
+        print(f"✅ Sweep written to {args.json_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""Pins proto.FrameRing's hold counting: a capture buffer is only reused once every holder has
+released it, and a frame flowing through the pipelined capture path is never overwritten while
+detection or the stream still reads it.
+
+    python -m pytest test_frame_ring.py
+"""
+import threading
+import time
+
+import numpy as np
+
+import proto
+
+
+def read_into(ring, value):
+    """Acquires a slot, fills its buffer with value like cv2.VideoCapture.read would, returns the frame."""
+    slot, buffer = ring.acquire()
+    if buffer is None:
+        buffer = np.empty((4, 4, 3), dtype=np.uint8)
+    buffer[...] = value
+    return ring.fill(slot, buffer)
+
+
+def test_buffer_is_reused_only_after_its_last_release():
+    ring = proto.FrameRing(slots=2)
+    first = read_into(ring, 1)
+    ring.retain(first)  # e.g. the stream broadcaster
+    second = read_into(ring, 2)
+    assert ring.acquire() is None  # Every slot held: the grabber must drop the camera frame
+
+    ring.release(first)
+    assert ring.acquire() is None  # Still held by the retainer
+    ring.release(first)
+    third = read_into(ring, 3)
+    assert third is first and second[0, 0, 0] == 2
+
+
+def test_failed_read_frees_its_slot():
+    ring = proto.FrameRing(slots=1)
+    slot, _ = ring.acquire()
+    assert ring.fill(slot, None) is None
+    assert ring.acquire() is not None
+
+
+def test_foreign_frames_are_ignored():
+    ring = proto.FrameRing(slots=1)
+    frame = read_into(ring, 1)
+    ring.retain(np.zeros((4, 4, 3), dtype=np.uint8))
+    ring.release(np.zeros((4, 4, 3), dtype=np.uint8))
+    ring.release(frame)
+    assert ring.acquire() is not None
+
+
+class FakeCamera:
+    """A camera much faster than detection that stamps every frame with its index, read in place."""
+
+    def __init__(self):
+        self.count = 0
+
+    def read(self, buffer=None):
+        time.sleep(0.002)
+        self.count += 1
+        if buffer is None or buffer.shape != (48, 64, 3):
+            buffer = np.empty((48, 64, 3), dtype=np.uint8)
+        buffer[...] = self.count % 256
+        return True, buffer
+
+    def grab(self):
+        time.sleep(0.002)
+        self.count += 1
+        return True
+
+
+def test_pipelined_frames_are_not_overwritten_while_in_use():
+    monitor = proto.YOLOv11MedicationMonitor(obj_weights_path="MOCK", session_id="ring", headless=True,
+                                             concurrent_detection=False, batched_inference=False)
+    monitor.cap = FakeCamera()
+
+    def slow_detect(frame):
+        stamp = int(frame[0, 0, 0])
+        time.sleep(0.03)
+        return {'stamp': stamp, 'stamp_after': int(frame[0, 0, 0])}
+
+    monitor._yolo_detect = slow_detect
+    monitor.broadcaster.subscribe()
+    stop = threading.Event()
+
+    def client():
+        seq = -1
+        while not stop.is_set():
+            monitor.broadcaster.wait_for_jpeg(seq, timeout=0.1)
+            seq = monitor.broadcaster.seq
+
+    threading.Thread(target=client, daemon=True).start()
+    frames, torn = monitor._pipelined_frames(True), 0
+    try:
+        for count, (_, _, frame, detections) in enumerate(frames, start=1):
+            time.sleep(0.01)  # Overlay / publish work while the camera keeps running
+            if {int(frame[0, 0, 0]), detections['stamp_after']} != {detections['stamp']}:
+                torn += 1
+            monitor.broadcaster.publish(frame, monitor._frame_ring)
+            if count == 15:
+                break
+    finally:
+        frames.close()
+        stop.set()
+    assert torn == 0
@@ -0,0 +1,186 @@
+"""Pins the verdict logic of proto.ProtocolStateMachine: phase order, the tracked-frame rule,
+the pill stillness tolerance and the hold timers at different frame rates.
+
+    python -m pytest test_protocol.py
+
+Sessions are stepped straight from detections dicts, so no models or camera are needed.
+"""
+import os
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+import proto
+
+FACE = {proto.UPPER_LIP_ID: None}  # Any non-None lip_landmarks means the face was found
+
+
+def detections(pill=0.0, pill_on_tongue=None, tongue=0.0, jaw_distance=10.0, face=True, tracked=False):
+    """A _yolo_detect-style detections dict. pill_on_tongue is a (cx, cy) centroid or None."""
+    result = {cls: (0.0, None) for cls in proto.TARGET_CLASSES}
+    result['pill'] = (pill, (100, 100, 20, 20) if pill else None)
+    if pill_on_tongue is not None:
+        result['pill-on-tongue'] = (0.9, (*pill_on_tongue, 15, 15))
+    result['tongue-no-pill'] = (tongue, (350, 450, 110, 55) if tongue else None)
+    result['jaw_distance'] = jaw_distance
+    result['lip_landmarks'] = FACE if face else None
+    if tracked:
+        result['tracked'] = True
+    return result
+
+
+def compliant(phase):
+    """What a patient following the prompts shows the camera in each phase."""
+    if phase == 1:
+        return detections(pill=0.95)
+    if phase == 2:
+        return detections(tongue=0.9, jaw_distance=30.0)
+    if phase == 3:
+        return detections(pill_on_tongue=(450, 500))
+    if phase == 4:
+        return detections(jaw_distance=2.0)
+    return detections(tongue=0.9)
+
+
+def run_compliant(machine, fps, max_frames=10000):
+    """Steps machine with compliant() detections until it finishes. Returns (detection log, phases seen)."""
+    record, log, phases = proto.DetectionRecord(), [], []
+    for _ in range(max_frames):
+        if not phases or phases[-1] != machine.phase:
+            phases.append(machine.phase)
+        log.append(compliant(machine.phase))
+        if machine.step(record.load(log[-1], 1.0 / fps)) == proto.TRANSITION_FINISH:
+            break
+    return log, phases
+
+
+@pytest.fixture
+def monitor():
+    return proto.YOLOv11MedicationMonitor(obj_weights_path="MOCK", session_id="test", headless=True,
+                                          concurrent_detection=False, batched_inference=False)
+
+
+def test_compliant_session_passes_through_every_phase():
+    machine = proto.ProtocolStateMachine()
+    _, phases = run_compliant(machine, fps=30)
+    assert machine.result_status == proto.VERIFIED_PASS
+    assert phases == [1, 2, 3, 4, 5, 6]
+    # 1 + 1 + 60 (pill still 2 s) + 51 (mouth closed 50/30 s, then the advancing frame) + 1 + 60 (final 2 s)
+    assert machine.frame_count == 174
+
+
+@pytest.mark.parametrize("fps", [15, 30, 60, 121, 240])
+def test_hold_timers_measure_seconds_not_frames(fps):
+    machine = proto.ProtocolStateMachine()
+    run_compliant(machine, fps)
+    assert machine.result_status == proto.VERIFIED_PASS
+    held = proto.PILL_STATIONARY_SECONDS + proto.CONCEALMENT_SECONDS + proto.FINAL_CONFIRMATION_SECONDS
+    assert held <= machine.elapsed + proto.TIMER_TOLERANCE_SECONDS
+    assert machine.elapsed <= held + 5.0 / fps
+
+
+@pytest.mark.parametrize("fps", [30, 240])
+def test_replay_detections_matches_the_state_machine(monitor, fps):
+    machine = proto.ProtocolStateMachine()
+    log, _ = run_compliant(machine, fps)
+    assert monitor.replay_detections(log, fps=fps) == machine.result_status == proto.VERIFIED_PASS
+    assert monitor.frame_count == machine.frame_count
+
+
+def test_face_loss_fails_after_stabilization_and_face_loss_seconds():
+    machine, record = proto.ProtocolStateMachine(), proto.DetectionRecord()
+    transition = proto.TRANSITION_NONE
+    while transition != proto.TRANSITION_FINISH:
+        transition = machine.step(record.load(detections(face=False), 1.0 / 30))
+    assert machine.result_status == "FATAL FAILURE (MOUTH COVERED)"
+    assert machine.frame_count == 80  # 20 stabilization frames + 2 s at 30 fps
+
+
+def test_tracked_frames_do_not_complete_a_phase():
+    machine, record = proto.ProtocolStateMachine(), proto.DetectionRecord()
+    for _ in range(10):
+        assert machine.step(record.load(detections(pill=0.95, tracked=True), 1.0 / 30)) == proto.TRANSITION_NONE
+    assert machine.phase == 1
+    assert machine.step(record.load(detections(pill=0.95), 1.0 / 30)) == proto.TRANSITION_ADVANCE
+    assert machine.phase == 2
+
+
+def test_tracked_pill_does_not_fail_phase_5():
+    machine = proto.ProtocolStateMachine()
+    record = proto.DetectionRecord()
+    machine.phase = 5
+    reappeared = detections(pill_on_tongue=(450, 500), tracked=True)
+    assert machine.step(record.load(reappeared, 1.0 / 30)) == proto.TRANSITION_NONE
+    reappeared.pop('tracked')
+    assert machine.step(record.load(reappeared, 1.0 / 30)) == proto.TRANSITION_FINISH
+    assert machine.result_status == "FATAL FAILURE (PILL REAPPEARED)"
+
+
+def _hold_pill(machine, jitter, seconds, fps=30):
+    """Steps phase 3 with the pill centroid alternating by +-jitter px. Returns the frames stepped."""
+    record = proto.DetectionRecord()
+    for i in range(int(seconds * fps)):
+        offset = jitter if i % 2 else -jitter
+        if machine.step(record.load(detections(pill_on_tongue=(450 + offset, 500)), 1.0 / fps)) == proto.TRANSITION_ADVANCE:
+            return i + 1
+    return None
+
+
+def test_pill_within_stability_threshold_counts_as_still():
+    machine = proto.ProtocolStateMachine()
+    machine.phase = 3
+    assert _hold_pill(machine, jitter=proto.STABILITY_THRESHOLD, seconds=3) == 60
+    assert machine.phase == 4
+
+
+def test_pill_moving_beyond_stability_threshold_does_not_advance():
+    machine = proto.ProtocolStateMachine()
+    machine.phase = 3
+    assert _hold_pill(machine, jitter=proto.STABILITY_THRESHOLD + 1, seconds=5) is None
+    assert machine.status == proto.STATUS_PILL_MOVING
+
+
+def test_motion_tolerance_overrides_stability_threshold():
+    machine = proto.ProtocolStateMachine(motion_tolerance=proto.STABILITY_THRESHOLD + 5)
+    machine.phase = 3
+    assert _hold_pill(machine, jitter=proto.STABILITY_THRESHOLD + 1, seconds=3) == 60
+
+
+def test_centroid_window_spread_matches_numpy():
+    rng = np.random.default_rng(0)
+    window, points = proto.CentroidWindow(2.0, initial_fps=10), []
+    for _ in range(2000):
+        x, y = rng.integers(0, 640, 2)
+        window.append(x, y, float(rng.choice([1 / 240, 1 / 30, 1 / 7])))
+        points.append((x, y))
+    recent = np.array(points[-len(window):], dtype=float)
+    assert window.duration < 2.0 + 1 / 7
+    assert window.spread() == pytest.approx(np.sqrt(((recent - recent.mean(axis=0)) ** 2).sum(axis=1).mean()))
+
+
+def test_phase_6_searches_the_full_frame(monitor):
+    monitor.roi_mode, monitor.mouth_roi = True, (100, 100, 300, 300)
+    searched = {}
+    for phase in range(1, 7):
+        monitor.current_phase = phase
+        searched[phase] = monitor._inference_roi()
+    assert searched == {1: None, 2: (100, 100, 300, 300), 3: (100, 100, 300, 300),
+                        4: (100, 100, 300, 300), 5: (100, 100, 300, 300), 6: None}
+
+
+def test_evidence_dirs_never_collide(tmp_path):
+    started_at = datetime(2026, 1, 1, 12, 0, 0)
+    recorders = [proto.EvidenceRecorder("bed", started_at, str(tmp_path)) for _ in range(3)]
+    for recorder in recorders:
+        recorder.finish("VERIFIED (PASS)")
+        recorder.join()
+    assert sorted(os.path.basename(recorder.path) for recorder in recorders) == \
+        ["bed_20260101_120000_000", "bed_20260101_120000_000_2", "bed_20260101_120000_000_3"]
+
+
+def test_mock_replay_reaches_a_verdict(monitor):
+    frames = [np.zeros((480, 640, 3), dtype=np.uint8)] * 300
+    assert monitor.replay(frames, render=True, fps=30) == proto.VERIFIED_PASS
+    assert monitor.frame_count == 174
+    assert monitor._get_mock_detections()['lip_landmarks'] is None  # Outside replay() the mock has no face
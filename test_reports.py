@@ -0,0 +1,68 @@
+"""Pins proto.ReportWriter's recovery paths: an index.json left stale by a crash between the
+append and the index write is rebuilt from the files, and reports that fail to write are
+retried rather than lost.
+
+    python -m pytest test_reports.py
+"""
+import json
+import os
+import time
+
+import proto
+
+
+def report(ended_at, session_id="bed", final_status=proto.VERIFIED_PASS):
+    return {"ended_at": ended_at, "session_id": session_id, "final_status": final_status}
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_stale_index_entry_is_rebuilt_from_its_file(tmp_path):
+    writer = proto.ReportWriter(str(tmp_path))
+    writer._load_index()
+    assert writer._write_batch([report("2026-03-01T08:00:00")]) == []
+
+    # A later append whose index write never happened
+    with open(tmp_path / "adherence_20260301.jsonl", 'a') as f:
+        f.write(json.dumps(report("2026-03-01T20:00:00", final_status="FATAL FAILURE (MOUTH COVERED)")) + '\n')
+
+    reloaded = proto.ReportWriter(str(tmp_path))
+    entry = reloaded.rollup()["adherence_20260301.jsonl"]
+    assert entry["count"] == 2 and entry["last"] == "2026-03-01T20:00:00"
+    assert entry["size"] == os.path.getsize(tmp_path / "adherence_20260301.jsonl")
+    assert [r["ended_at"] for r in reloaded.query(since="2026-03-01T12:00:00")] == ["2026-03-01T20:00:00"]
+
+
+def test_index_entry_for_a_deleted_file_is_dropped(tmp_path):
+    writer = proto.ReportWriter(str(tmp_path))
+    writer._load_index()
+    writer._write_batch([report("2026-03-01T08:00:00"), report("2026-03-02T08:00:00")])
+    os.remove(tmp_path / "adherence_20260301.jsonl")
+    assert list(proto.ReportWriter(str(tmp_path)).rollup()) == ["adherence_20260302.jsonl"]
+
+
+def test_unwritten_reports_are_retried(tmp_path, monkeypatch):
+    monkeypatch.setattr(proto, "REPORT_FLUSH_SECONDS", 0.05)
+    report_dir = tmp_path / "reports"
+    report_dir.write_text("")  # A file where the directory should be: every write fails
+    writer = proto.ReportWriter(str(report_dir))
+    writer.submit(report("2026-03-01T08:00:00"))
+    writer.submit(report("2026-03-01T09:00:00"))
+
+    time.sleep(0.2)
+    assert len(writer.query()) == 2  # Still served from the pending reports
+
+    report_dir.unlink()
+    assert wait_for(lambda: (report_dir / "adherence_20260301.jsonl").exists())
+    writer.close()
+    assert writer._pending == []
+    with open(report_dir / "adherence_20260301.jsonl") as f:
+        assert [json.loads(line)["ended_at"] for line in f] == ["2026-03-01T08:00:00", "2026-03-01T09:00:00"]
+    assert proto.ReportWriter(str(report_dir)).rollup()["adherence_20260301.jsonl"]["count"] == 2